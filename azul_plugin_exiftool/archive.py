@@ -0,0 +1,177 @@
+"""Content addressed archive of raw exiftool json output.
+
+Keeping the raw output lets features be re-derived after changes to the field mappings or limits without
+running exiftool again. Output is stored gzipped under `<dir>/<exiftool version>/<sha256[:2]>/<sha256>.json.gz`.
+"""
+
+import argparse
+import concurrent.futures
+import functools
+import gzip
+import itertools
+import json
+import os
+import subprocess  # nosec B404
+import sys
+import tempfile
+from typing import Iterator
+
+# identifies the first line of an exported archive
+EXPORT_FORMAT = "azul-plugin-exiftool-raw-archive"
+EXPORT_FORMAT_VERSION = 1
+
+
+@functools.lru_cache
+def exiftool_version(exiftool: str = "exiftool") -> str:
+    """Return the version of the installed exiftool."""
+    p = subprocess.run([exiftool, "-ver"], capture_output=True, check=True, timeout=30)  # noqa: S603
+    return p.stdout.decode("utf-8").strip()
+
+
+class RawArchive:
+    """Store and look up raw exiftool output produced by a given exiftool version."""
+
+    def __init__(self, directory: str, version: str):
+        self.directory = directory
+        self.version = version
+
+    def path_for(self, sha256: str, version: str | None = None) -> str:
+        """Return where the output for a sample is stored."""
+        return os.path.join(self.directory, version or self.version, sha256[:2], f"{sha256}.json.gz")
+
+    def __contains__(self, sha256: str) -> bool:
+        """Whether output for the sample is archived."""
+        return os.path.exists(self.path_for(sha256))
+
+    def get(self, sha256: str) -> bytes | None:
+        """Return the archived output for a sample, if any."""
+        try:
+            with gzip.open(self.path_for(sha256), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, sha256: str, stdout: bytes, overwrite: bool = False) -> bool:
+        """Archive the output for a sample, returning False if it was already archived."""
+        path = self.path_for(sha256)
+        if not overwrite and os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename so concurrent readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+                f.write(stdout)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return True
+
+    def versions(self) -> list[str]:
+        """Return the exiftool versions with archived output."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(v for v in os.listdir(self.directory) if os.path.isdir(os.path.join(self.directory, v)))
+
+    def iter_paths(self, version: str | None = None) -> Iterator[tuple[str, str, str]]:
+        """Yield (sha256, exiftool version, file path) for every archived output of a version (default all)."""
+        for v in [version] if version else self.versions():
+            root = os.path.join(self.directory, v)
+            if not os.path.isdir(root):
+                continue
+            for prefix in sorted(os.listdir(root)):
+                for name in sorted(os.listdir(os.path.join(root, prefix))):
+                    if name.endswith(".json.gz"):
+                        yield name[: -len(".json.gz")], v, os.path.join(root, prefix, name)
+
+
+def export_archive(archive: RawArchive, destination: str, versions: list[str] | None = None) -> dict:
+    """Write archived output of the given exiftool versions (default all) to a single gzipped jsonl file.
+
+    The first line is a header, each following line holds one sample's output.
+    """
+    versions = versions or archive.versions()
+    counts = {v: 0 for v in versions}
+    with gzip.open(destination, "wt", encoding="utf-8", compresslevel=9) as out:
+        out.write(json.dumps({"format": EXPORT_FORMAT, "format_version": EXPORT_FORMAT_VERSION}) + "\n")
+        for version in versions:
+            for sha256, _, path in archive.iter_paths(version):
+                with gzip.open(path, "rb") as f:
+                    stdout = f.read()
+                # exiftool writes utf-8 json, surrogateescape round trips anything else
+                text = stdout.decode("utf-8", "surrogateescape")
+                out.write(json.dumps({"sha256": sha256, "exiftool_version": version, "stdout": text}) + "\n")
+                counts[version] += 1
+    return {"exported": sum(counts.values()), "versions": counts}
+
+
+def import_archive(
+    archive: RawArchive,
+    source: str,
+    allow_version_mismatch: bool = False,
+    batch_size: int = 1000,
+    workers: int = 8,
+) -> dict:
+    """Load an exported archive, skipping output from other exiftool versions unless allowed.
+
+    Entries are written in batches across a pool of threads, existing output is never overwritten.
+    """
+    summary = {"imported": 0, "already_present": 0, "version_mismatch": 0}
+
+    def write(entry: dict) -> bool:
+        target = RawArchive(archive.directory, entry["exiftool_version"])
+        return target.put(entry["sha256"], entry["stdout"].encode("utf-8", "surrogateescape"))
+
+    with gzip.open(source, "rt", encoding="utf-8") as f, concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        header = json.loads(f.readline() or "{}")
+        if header.get("format") != EXPORT_FORMAT or header.get("format_version") != EXPORT_FORMAT_VERSION:
+            raise ValueError(f"{source} is not an exported exiftool archive (header {header})")
+        entries = map(json.loads, f)
+        while batch := list(itertools.islice(entries, batch_size)):
+            wanted = []
+            for entry in batch:
+                if entry["exiftool_version"] != archive.version and not allow_version_mismatch:
+                    summary["version_mismatch"] += 1
+                else:
+                    wanted.append(entry)
+            for written in pool.map(write, wanted):
+                summary["imported" if written else "already_present"] += 1
+    return summary
+
+
+def main(argv: list[str] | None = None):
+    """Export or import a raw exiftool output archive via command-line."""
+    parser = argparse.ArgumentParser(description="Move archived exiftool output between deployments.")
+    parser.add_argument("archive_dir", help="The raw_archive_dir of this deployment.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Export archived output to a single compressed file.")
+    export.add_argument("destination", help="File to write, eg. results.jsonl.gz")
+    export.add_argument(
+        "--exiftool-version", action="append", help="Only export this exiftool version (repeatable, default all)."
+    )
+    load = sub.add_parser("import", help="Bulk load an exported file, eg. to start a new deployment with a hot cache.")
+    load.add_argument("source", help="File written by export.")
+    load.add_argument("--exiftool", default="exiftool", help="exiftool binary whose version output must match.")
+    load.add_argument(
+        "--allow-version-mismatch", action="store_true", help="Also import output from other exiftool versions."
+    )
+    load.add_argument("--batch-size", type=int, default=1000, help="Entries written per batch.")
+    load.add_argument("--workers", type=int, default=8, help="Threads writing each batch.")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        summary = export_archive(RawArchive(args.archive_dir, ""), args.destination, args.exiftool_version)
+    else:
+        summary = import_archive(
+            RawArchive(args.archive_dir, exiftool_version(args.exiftool)),
+            args.source,
+            args.allow_version_mismatch,
+            args.batch_size,
+            args.workers,
+        )
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
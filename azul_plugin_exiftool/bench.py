@@ -0,0 +1,408 @@
+"""Measurement tools for tuning how the plugin runs exiftool."""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+
+from azul_plugin_exiftool import imagefast
+from azul_plugin_exiftool.archive import exiftool_version
+from azul_plugin_exiftool.bulk import iter_paths, jsonable_features, jsonable_state, parse_config
+from azul_plugin_exiftool.main import (
+    EMBEDDED_OPTIONS,
+    EXIFTOOL_CONFIG,
+    AzulPluginExifTool,
+    exiftool_command,
+    feature_values,
+)
+from azul_plugin_exiftool.replay import recorded_runs
+from azul_plugin_exiftool.slowjobs import ScanTrace
+from azul_plugin_exiftool.spawn import Launcher
+
+
+def summarise(samples: list[float]) -> dict[str, float]:
+    """Summarise a list of durations in seconds."""
+    return {
+        "runs": len(samples),
+        "min": round(min(samples), 6),
+        "median": round(statistics.median(samples), 6),
+        "mean": round(statistics.fmean(samples), 6),
+        "max": round(max(samples), 6),
+    }
+
+
+def time_command(args: list[str], runs: int) -> list[float]:
+    """Run a command repeatedly, returning the wall time of each run."""
+    env = dict(os.environ)
+    env["TZ"] = "UTC"
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, env=env, capture_output=True, check=False)  # noqa: S603
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def measure_startup(runs: int = 20, exiftool: str = "exiftool", sample: str | None = None) -> dict:
+    """Measure exiftool cold-start cost with its default config lookup and with the plugin's empty config.
+
+    Each variant runs over the same tiny sample so the cost is dominated by interpreter startup and module loading.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        if sample is None:
+            sample = os.path.join(tmp, "sample.json")
+            with open(sample, "w") as f:
+                json.dump({"startup": "measurement"}, f)
+        variants = {
+            "version_only": [exiftool, "-ver"],
+            "default_config": exiftool_command(sample, exiftool=exiftool),
+            "plugin_config": exiftool_command(sample, EXIFTOOL_CONFIG, exiftool=exiftool),
+            "plugin_config_no_composite": exiftool_command(
+                sample, EXIFTOOL_CONFIG, composite=False, exiftool=exiftool
+            ),
+        }
+        # one untimed run so every variant sees a warm page cache
+        time_command(variants["default_config"], 1)
+        return {name: summarise(time_command(args, runs)) for name, args in variants.items()}
+
+
+def measure_spawn(runs: int = 200, exiftool: str = "exiftool") -> dict:
+    """Compare the per-run cost of subprocess.run, called as the plugin does by default, with the posix_spawn launcher.
+
+    `true` isolates the cost of spawning itself, `exiftool -ver` adds exiftool's startup. Runs are interleaved so
+    both methods see the same system conditions.
+    """
+    launcher = Launcher()
+    result: dict = {"fd_limit": resource.getrlimit(resource.RLIMIT_NOFILE)[0]}
+    for name, args in {"true": ["true"], "exiftool_version": [exiftool, "-ver"]}.items():
+        samples = {"subprocess_run": [], "posix_spawn": []}
+        for _ in range(runs):
+            start = time.perf_counter()
+            env = dict(os.environ)
+            env["TZ"] = "UTC"
+            subprocess.run(args, env=env, capture_output=True, timeout=60)  # noqa: S603
+            samples["subprocess_run"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            launcher.run(args, 60)
+            samples["posix_spawn"].append(time.perf_counter() - start)
+        result[name] = {method: summarise(s) for method, s in samples.items()}
+        before = result[name]["subprocess_run"]["median"]
+        result[name]["median_saving_percent"] = (
+            round(100 * (before - result[name]["posix_spawn"]["median"]) / before, 2) if before else 0.0
+        )
+    return result
+
+
+def feature_size(features: dict) -> tuple[int, int]:
+    """Return the number of feature values and their serialised size in bytes."""
+    serialised = jsonable_features(features)
+    count = sum(len(v) for v in serialised.values())
+    return count, len(json.dumps(serialised, ensure_ascii=False).encode("utf-8"))
+
+
+def measure_compact(paths: list[str], config: dict | None = None) -> dict:
+    """Compare feature value count and serialised size of full and compact output over a corpus.
+
+    exiftool runs once per file and both outputs are derived from the same json.
+    """
+    full = AzulPluginExifTool(config={**(config or {}), "compact_output": False})
+    compact = AzulPluginExifTool(config={**(config or {}), "compact_output": True})
+    totals = {"files": 0, "full_values": 0, "compact_values": 0, "full_bytes": 0, "compact_bytes": 0}
+    for path in iter_paths(paths):
+        p = full.run_exiftool(path)
+        if p.returncode:
+            continue
+        stdout = p.stdout.decode("utf-8")
+        full_values, full_bytes = feature_size(full.features(stdout)[0])
+        compact_values, compact_bytes = feature_size(compact.features(stdout)[0])
+        totals["files"] += 1
+        totals["full_values"] += full_values
+        totals["compact_values"] += compact_values
+        totals["full_bytes"] += full_bytes
+        totals["compact_bytes"] += compact_bytes
+    for unit in ("values", "bytes"):
+        before = totals[f"full_{unit}"]
+        totals[f"{unit}_reduction_percent"] = (
+            round(100 * (before - totals[f"compact_{unit}"]) / before, 2) if before else 0.0
+        )
+    return totals
+
+
+def measure_embedded(paths: list[str], config: dict | None = None) -> dict:
+    """Compare exiftool latency and output size with and without embedded extraction, per exiftool FileType.
+
+    Published sizes are after the configured embedded_max_docs and embedded_max_bytes limits.
+    """
+    plugin = AzulPluginExifTool(config=config or {})
+    totals = {}
+    for path in iter_paths(paths):
+        trace = ScanTrace(path)
+        start = time.perf_counter()
+        plain = plugin.run_exiftool(path, trace)
+        plain_seconds = time.perf_counter() - start
+        if plain.returncode:
+            continue
+        plain_result = plugin.process_output(plain, trace)
+        start = time.perf_counter()
+        embedded = plugin.run_exiftool(path, options=EMBEDDED_OPTIONS)
+        embedded_seconds = time.perf_counter() - start
+        embedded_result = plugin.process_output(embedded)
+        docs = {
+            (fv.label or "").split(":", 1)[0]
+            for fv in feature_values(embedded_result.features, "exif_embedded_metadata")
+        }
+        t = totals.setdefault(
+            trace.file_type or "unknown",
+            {
+                "files": 0,
+                "files_with_embedded": 0,
+                "published_embedded_docs": 0,
+                "plain_seconds": 0.0,
+                "embedded_seconds": 0.0,
+                "plain_stdout_bytes": 0,
+                "embedded_stdout_bytes": 0,
+                "plain_published_bytes": 0,
+                "embedded_published_bytes": 0,
+            },
+        )
+        t["files"] += 1
+        t["files_with_embedded"] += bool(docs)
+        t["published_embedded_docs"] += len(docs)
+        t["plain_seconds"] += plain_seconds
+        t["embedded_seconds"] += embedded_seconds
+        t["plain_stdout_bytes"] += len(plain.stdout)
+        t["embedded_stdout_bytes"] += len(embedded.stdout)
+        t["plain_published_bytes"] += feature_size(plain_result.features)[1]
+        t["embedded_published_bytes"] += feature_size(embedded_result.features)[1]
+    for t in totals.values():
+        for measure in ("seconds", "stdout_bytes", "published_bytes"):
+            before = t[f"plain_{measure}"]
+            t[f"{measure}_overhead_percent"] = (
+                round(100 * (t[f"embedded_{measure}"] - before) / before, 2) if before else 0.0
+            )
+        t["plain_seconds"] = round(t["plain_seconds"], 6)
+        t["embedded_seconds"] = round(t["embedded_seconds"], 6)
+    return dict(sorted(totals.items(), key=lambda x: -x[1]["files"]))
+
+
+def feature_diff(before: dict, after: dict) -> dict:
+    """Return the feature values only present before (removed) and only present after (added), by feature."""
+    old_values = jsonable_features(before)
+    new_values = jsonable_features(after)
+    diff = {"removed": {}, "added": {}}
+    for name in sorted(set(old_values) | set(new_values)):
+        old = {json.dumps(v, sort_keys=True): v for v in old_values.get(name, [])}
+        new = {json.dumps(v, sort_keys=True): v for v in new_values.get(name, [])}
+        removed = [v for k, v in old.items() if k not in new]
+        added = [v for k, v in new.items() if k not in old]
+        if removed:
+            diff["removed"][name] = removed
+        if added:
+            diff["added"][name] = added
+    return diff
+
+
+def compare_exiftools(
+    paths: list[str], baseline: str, candidate: str, repeat: int = 1, max_diffs: int = 100, config: dict | None = None
+) -> dict:
+    """Run two exiftool binaries over a corpus through the same features transform.
+
+    Reports per exiftool FileType latency (the fastest of `repeat` runs), peak exiftool memory and how many files'
+    published features or state changed, along with the first `max_diffs` differences in full.
+    """
+    plugins = {
+        # posix_spawn so each run reports its peak memory
+        name: AzulPluginExifTool(config={**(config or {}), "exiftool_path": exiftool, "spawn_method": "posix_spawn"})
+        for name, exiftool in (("baseline", baseline), ("candidate", candidate))
+    }
+    file_types = {}
+    diffs = []
+    for path in iter_paths(paths):
+        results = {}
+        for name, plugin in plugins.items():
+            seconds = []
+            for _ in range(max(repeat, 1)):
+                trace = ScanTrace(path)
+                start = time.perf_counter()
+                p = plugin.run_exiftool(path, trace)
+                seconds.append(time.perf_counter() - start)
+            results[name] = (plugin.process_output(p, trace), trace, min(seconds))
+        (before, before_trace, before_seconds), (after, after_trace, after_seconds) = results.values()
+        t = file_types.setdefault(
+            before_trace.file_type or after_trace.file_type or "unknown",
+            {
+                "files": 0,
+                "files_changed": 0,
+                "baseline_seconds": 0.0,
+                "candidate_seconds": 0.0,
+                "baseline_peak_rss_kb": 0,
+                "candidate_peak_rss_kb": 0,
+            },
+        )
+        t["files"] += 1
+        t["baseline_seconds"] += before_seconds
+        t["candidate_seconds"] += after_seconds
+        t["baseline_peak_rss_kb"] = max(t["baseline_peak_rss_kb"], before_trace.exiftool_maxrss_kb or 0)
+        t["candidate_peak_rss_kb"] = max(t["candidate_peak_rss_kb"], after_trace.exiftool_maxrss_kb or 0)
+        diff = feature_diff(before.features, after.features)
+        states = [jsonable_state(before.state), jsonable_state(after.state)]
+        if before.malformed != after.malformed:
+            states = [{"malformed": before.malformed}, {"malformed": after.malformed}]
+        if diff["removed"] or diff["added"] or states[0] != states[1]:
+            t["files_changed"] += 1
+            if len(diffs) < max_diffs:
+                diffs.append({"path": path, "file_type": before_trace.file_type, "state": states, **diff})
+    for t in file_types.values():
+        before = t["baseline_seconds"]
+        t["latency_delta_percent"] = round(100 * (t["candidate_seconds"] - before) / before, 2) if before else 0.0
+        t["baseline_mean_seconds"] = round(before / t["files"], 6)
+        t["candidate_mean_seconds"] = round(t["candidate_seconds"] / t["files"], 6)
+        del t["baseline_seconds"], t["candidate_seconds"]
+    return {
+        "baseline": {"exiftool": baseline, "version": exiftool_version(baseline)},
+        "candidate": {"exiftool": candidate, "version": exiftool_version(candidate)},
+        "file_types": dict(sorted(file_types.items(), key=lambda x: -x[1]["files"])),
+        "diffs": diffs,
+    }
+
+
+def compare_image_fast_path(paths: list[str], max_diffs: int = 100, config: dict | None = None) -> dict:
+    """Compare the in-process image fast path against exiftool over a corpus.
+
+    Reports per exiftool FileType how many files the fast path answered or fell back on, the throughput of both
+    and how many answered files' features differ from exiftool's, along with the first `max_diffs` in full.
+    """
+    plugin = AzulPluginExifTool(config={**(config or {}), "image_fast_path": False})
+    composite = plugin.cfg.exiftool_composite  # ty: ignore[unresolved-attribute]
+    file_types = {}
+    diffs = []
+    for path in iter_paths(paths):
+        start = time.perf_counter()
+        record = imagefast.parse(path, composite)
+        fast_seconds = time.perf_counter() - start
+        trace = ScanTrace(path)
+        start = time.perf_counter()
+        p = plugin.run_exiftool(path, trace)
+        exiftool_seconds = time.perf_counter() - start
+        expected = plugin.process_output(p, trace)
+        t = file_types.setdefault(
+            trace.file_type or "unknown",
+            {"files": 0, "hits": 0, "files_changed": 0, "fast_seconds": 0.0, "exiftool_seconds": 0.0},
+        )
+        t["files"] += 1
+        t["fast_seconds"] += fast_seconds
+        t["exiftool_seconds"] += exiftool_seconds
+        if record is None:
+            continue
+        t["hits"] += 1
+        fast = plugin.build_result(*plugin.feature_records([record]), ScanTrace(path), "native")
+        fast.features.pop("exif_extraction_mode", None)
+        diff = feature_diff(expected.features, fast.features)
+        if diff["removed"] or diff["added"]:
+            t["files_changed"] += 1
+            if len(diffs) < max_diffs:
+                diffs.append({"path": path, "file_type": trace.file_type, **diff})
+    for t in file_types.values():
+        t["hit_percent"] = round(100 * t["hits"] / t["files"], 2)
+        t["fallback_percent"] = round(100 - t["hit_percent"], 2)
+        # a fallback pays for the attempt as well as the exiftool run
+        t["fast_path_files_per_second"] = round(t["files"] / t["fast_seconds"], 3) if t["fast_seconds"] else 0.0
+        t["exiftool_files_per_second"] = round(t["files"] / t["exiftool_seconds"], 3) if t["exiftool_seconds"] else 0.0
+        t["speedup"] = round(t["exiftool_seconds"] / t["fast_seconds"], 1) if t["fast_seconds"] else 0.0
+        del t["fast_seconds"], t["exiftool_seconds"]
+    return {
+        "exiftool_version": exiftool_version(plugin.cfg.exiftool_path),  # ty: ignore[unresolved-attribute]
+        "file_types": dict(sorted(file_types.items(), key=lambda x: -x[1]["files"])),
+        "diffs": diffs,
+    }
+
+
+def measure_replay(fixture_dir: str, repeat: int = 5, config: dict | None = None) -> dict:
+    """Time the features and state mapping over recorded exiftool runs, without spawning exiftool."""
+    plugin = AzulPluginExifTool(config=config or {})
+    runs = [p for _, p in recorded_runs(fixture_dir)]
+    if not runs:
+        raise ValueError(f"no recorded exiftool runs in {fixture_dir}")
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for p in runs:
+            plugin.process_output(p)
+        samples.append(time.perf_counter() - start)
+    median = statistics.median(samples)
+    return {
+        "runs": len(runs),
+        "stdout_bytes": sum(len(p.stdout) for p in runs),
+        "pass_seconds": summarise(samples),
+        "runs_per_second": round(len(runs) / median, 3) if median else 0.0,
+    }
+
+
+def main(argv: list[str] | None = None):
+    """Run measurements via command-line."""
+    parser = argparse.ArgumentParser(description="Measure how the plugin runs exiftool.")
+    parser.add_argument("--exiftool", default="exiftool", help="exiftool binary to measure.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    startup = sub.add_parser("startup", help="exiftool cold-start cost with and without the plugin's empty config.")
+    startup.add_argument("--runs", type=int, default=20, help="Runs per variant.")
+    startup.add_argument("--sample", help="File to scan on each run (default a tiny generated json file).")
+
+    spawn = sub.add_parser("spawn", help="Per-run cost of subprocess.run against the posix_spawn launcher.")
+    spawn.add_argument("--runs", type=int, default=200, help="Runs per method and command.")
+
+    compact = sub.add_parser("compact", help="Feature count and size reduction of compact_output over a corpus.")
+    compact.add_argument("paths", nargs="+", help="Files or directories to measure.")
+    compact.add_argument(
+        "-c", "--config", action="append", default=[], help="Plugin config override as KEY=VALUE (repeatable)."
+    )
+
+    embedded = sub.add_parser("embedded", help="Latency and output size overhead of -ee per file type.")
+    embedded.add_argument("paths", nargs="+", help="Files or directories to measure.")
+    embedded.add_argument("--max-docs", type=int, default=16, help="embedded_max_docs to publish with.")
+    embedded.add_argument("--max-bytes", type=int, default=64 * 1024, help="embedded_max_bytes to publish with.")
+
+    compare = sub.add_parser("compare", help="Latency, memory and output differences between two exiftools.")
+    compare.add_argument("baseline", help="Current exiftool executable.")
+    compare.add_argument("candidate", help="exiftool executable to qualify, eg. an upgrade.")
+    compare.add_argument("paths", nargs="+", help="Files or directories to compare over.")
+    compare.add_argument("--repeat", type=int, default=1, help="Runs per file and exiftool, the fastest is kept.")
+    compare.add_argument("--max-diffs", type=int, default=100, help="Files whose differences are listed in full.")
+
+    fast = sub.add_parser("imagefast", help="Hit rate, throughput and parity of the image fast path against exiftool.")
+    fast.add_argument("paths", nargs="+", help="Files or directories to compare over.")
+    fast.add_argument("--max-diffs", type=int, default=100, help="Files whose differences are listed in full.")
+
+    replay = sub.add_parser("replay", help="Time features and state mapping over recorded exiftool fixtures.")
+    replay.add_argument("fixture_dir", help="Directory recorded with the exiftool_record_dir setting.")
+    replay.add_argument("--repeat", type=int, default=5, help="Passes over the fixtures.")
+
+    args = parser.parse_args(argv)
+    if args.command == "startup":
+        result = measure_startup(args.runs, args.exiftool, args.sample)
+    elif args.command == "spawn":
+        result = measure_spawn(args.runs, args.exiftool)
+    elif args.command == "compact":
+        result = measure_compact(args.paths, {"exiftool_path": args.exiftool, **parse_config(args.config)})
+    elif args.command == "embedded":
+        result = measure_embedded(
+            args.paths,
+            {"exiftool_path": args.exiftool, "embedded_max_docs": args.max_docs, "embedded_max_bytes": args.max_bytes},
+        )
+    elif args.command == "compare":
+        result = compare_exiftools(args.paths, args.baseline, args.candidate, args.repeat, args.max_diffs)
+    elif args.command == "imagefast":
+        result = compare_image_fast_path(args.paths, args.max_diffs, {"exiftool_path": args.exiftool})
+    elif args.command == "replay":
+        result = measure_replay(args.fixture_dir, args.repeat, {"exiftool_path": args.exiftool})
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
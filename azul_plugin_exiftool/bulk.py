@@ -0,0 +1,322 @@
+"""Offline bulk scanning of local files with the ExifTool plugin, for backfilling large corpora."""
+
+import argparse
+import concurrent.futures
+import contextlib
+import gzip
+import itertools
+import json
+import os
+import subprocess  # nosec B404
+import sys
+import time
+from collections import Counter
+from typing import Iterable, Iterator, TextIO
+
+from azul_runner import FeatureValue, State
+
+from azul_plugin_exiftool.archive import RawArchive
+from azul_plugin_exiftool.main import AzulPluginExifTool, ScanResult
+from azul_plugin_exiftool.pipeline import PipelineItem, ScanPipeline
+
+
+def iter_paths(paths: Iterable[str], file_list: str | None = None) -> Iterator[str]:
+    """Yield every file under the given paths, followed by those listed in file_list ('-' for stdin)."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                # walk in a stable order so resumed runs see files in the same sequence
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+    if file_list:
+        with open(file_list) if file_list != "-" else contextlib.nullcontext(sys.stdin) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+
+
+def load_checkpoint(output: str) -> set[str]:
+    """Return the paths already recorded in an existing output file."""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output) as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["path"])
+            except (ValueError, KeyError):
+                # partially written final line from an interrupted run, that file is rescanned
+                continue
+    return done
+
+
+def ends_with_newline(path: str) -> bool:
+    """Return True if the file is empty or its last byte is a newline."""
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def jsonable_features(features: dict) -> dict:
+    """Convert a features dict into plain json types."""
+    out = {}
+    for name, values in features.items():
+        if not isinstance(values, list):
+            values = [values]
+        out[name] = [
+            {"value": str(v.value), "label": v.label} if isinstance(v, FeatureValue) else {"value": str(v)}
+            for v in values
+        ]
+    return out
+
+
+def jsonable_state(state: State | None) -> dict:
+    """Convert a State into plain json types, None meaning completed."""
+    if state is None:
+        return {"label": State.Label.COMPLETED.value}
+    out = {"label": getattr(state.label, "value", str(state.label))}
+    for attr in ("failure_name", "message"):
+        if getattr(state, attr, None):
+            out[attr] = getattr(state, attr)
+    return out
+
+
+def result_record(result: ScanResult, **fields) -> dict:
+    """Build the jsonl record for a single result, starting with the given identifying fields."""
+    record = {**fields, "mode": result.mode, "state": jsonable_state(result.state)}
+    if result.malformed is not None:
+        # mirror the state BinaryPlugin.is_malformed publishes for a job, the reason is kept beside the features
+        record["state"] = jsonable_state(State(State.Label.COMPLETED_WITH_ERRORS, message=result.malformed))
+        record["malformed"] = result.malformed
+    record["features"] = jsonable_features(result.features)
+    return record
+
+
+def scan_one(plugin: AzulPluginExifTool, path: str) -> dict:
+    """Scan a single file, converting any exception into an error record."""
+    start = time.perf_counter()
+    try:
+        size = os.path.getsize(path)
+        result = plugin.scan_path(path)
+    except Exception as e:
+        size = os.path.getsize(path) if os.path.exists(path) else -1
+        result = ScanResult(state=State(State.Label.ERROR_EXCEPTION, message=f"{type(e).__name__}: {e}"))
+    return result_record(result, path=path, size=size, seconds=round(time.perf_counter() - start, 6))
+
+
+def bulk_scan(
+    plugin: AzulPluginExifTool,
+    paths: Iterable[str],
+    out: TextIO,
+    workers: int,
+    skip: set[str] | None = None,
+    pipeline: ScanPipeline | None = None,
+) -> dict:
+    """Scan paths with a pool of workers, writing a jsonl record per file as it completes.
+
+    exiftool runs as a child process so threads are sufficient to keep every core busy.
+    When a pipeline is supplied it is used instead, overlapping the stages of different files.
+    Returns a throughput summary.
+    """
+    skip = skip or set()
+    states = Counter()
+    files = 0
+    total_bytes = 0
+    skipped = 0
+    start = time.perf_counter()
+
+    def write(record: dict):
+        nonlocal files, total_bytes
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        files += 1
+        total_bytes += max(record["size"], 0)
+        states[record["state"]["label"]] += 1
+
+    def unscanned():
+        nonlocal skipped
+        for path in paths:
+            if path in skip:
+                skipped += 1
+                continue
+            yield path
+
+    stages = None
+    if pipeline is not None:
+
+        def on_result(item: PipelineItem, seconds: float):
+            if item.result is None:
+                raise RuntimeError(f"{item.path} left the pipeline without a result")
+            size = os.path.getsize(item.path) if os.path.exists(item.path) else -1
+            write(result_record(item.result, path=item.path, size=size, seconds=round(seconds, 6)))
+
+        stages = pipeline.run(unscanned(), on_result)["stages"]
+    else:
+        # bound the number of outstanding futures so huge corpora are not enumerated into memory
+        max_pending = workers * 4
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+
+            def drain(return_when):
+                nonlocal pending
+                done, pending = concurrent.futures.wait(pending, return_when=return_when)
+                for fut in done:
+                    write(fut.result())
+
+            for path in unscanned():
+                pending.add(pool.submit(scan_one, plugin, path))
+                if len(pending) >= max_pending:
+                    drain(concurrent.futures.FIRST_COMPLETED)
+            drain(concurrent.futures.ALL_COMPLETED)
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "files": files,
+        "skipped": skipped,
+        "bytes": total_bytes,
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(files / elapsed, 3) if elapsed else 0.0,
+        "mib_per_second": round(total_bytes / (1024 * 1024) / elapsed, 3) if elapsed else 0.0,
+        "states": dict(states),
+    }
+    if stages is not None:
+        summary["stages"] = stages
+    if plugin.scheduler.enabled:
+        summary["lanes"] = plugin.scheduler.report()
+    return summary
+
+
+# plugin instance owned by each re-derivation worker process
+_worker_plugin: AzulPluginExifTool | None = None
+
+
+def _init_rederive_worker(config: dict):
+    global _worker_plugin
+    _worker_plugin = AzulPluginExifTool(config=config)
+
+
+def rederive_one(entry: tuple[str, str, str]) -> dict:
+    """Re-derive features for one archived exiftool output."""
+    sha256, version, path = entry
+    if _worker_plugin is None:
+        raise RuntimeError("re-derivation worker was not initialised")
+    with gzip.open(path, "rb") as f:
+        stdout = f.read()
+    try:
+        result = _worker_plugin.process_output(subprocess.CompletedProcess([], 0, stdout, b""))
+    except Exception as e:
+        result = ScanResult(state=State(State.Label.ERROR_EXCEPTION, message=f"{type(e).__name__}: {e}"))
+    return result_record(result, sha256=sha256, exiftool_version=version)
+
+
+def rederive(
+    archive: RawArchive, out: TextIO, workers: int, config: dict | None = None, version: str | None = None
+) -> dict:
+    """Re-run just the features transform over archived exiftool output, writing a jsonl record per sample.
+
+    Parsing json is cpu bound so this uses worker processes rather than threads.
+    """
+    states = Counter()
+    outputs = 0
+    start = time.perf_counter()
+    entries = archive.iter_paths(version)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_rederive_worker, initargs=(config or {},)
+    ) as pool:
+        # submit in batches so huge archives are not enumerated into memory
+        while batch := list(itertools.islice(entries, 10000)):
+            for record in pool.map(rederive_one, batch, chunksize=64):
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                outputs += 1
+                states[record["state"]["label"]] += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "outputs": outputs,
+        "seconds": round(elapsed, 3),
+        "outputs_per_second": round(outputs / elapsed, 3) if elapsed else 0.0,
+        "states": dict(states),
+    }
+
+
+def parse_config(items: list[str]) -> dict[str, str]:
+    """Parse KEY=VALUE plugin config overrides."""
+    config = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"config override must be KEY=VALUE, got {item!r}")
+        config[key.strip()] = value.strip()
+    return config
+
+
+def main(argv: list[str] | None = None):
+    """Run a bulk scan via command-line."""
+    parser = argparse.ArgumentParser(description="Scan many local files with exiftool, writing results as jsonl.")
+    parser.add_argument("paths", nargs="*", help="Files or directories to scan (directories are walked).")
+    parser.add_argument("--file-list", help="File containing one path per line to scan, '-' for stdin.")
+    parser.add_argument("-o", "--output", required=True, help="jsonl file to write one result per line to.")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Parallel exiftool workers.")
+    parser.add_argument(
+        "--resume", action="store_true", help="Append to an existing output, skipping paths already recorded."
+    )
+    parser.add_argument(
+        "-c", "--config", action="append", default=[], help="Plugin config override as KEY=VALUE (repeatable)."
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Overlap prechecks, exiftool runs (--workers) and post-processing of different files in stages.",
+    )
+    parser.add_argument("--precheck-workers", type=int, default=2, help="Precheck stage threads with --pipeline.")
+    parser.add_argument("--post-workers", type=int, default=2, help="Post-processing stage threads with --pipeline.")
+    parser.add_argument("--queue-size", type=int, default=64, help="Bound of each queue between stages.")
+    parser.add_argument(
+        "--rederive",
+        metavar="ARCHIVE_DIR",
+        help="Re-derive features from a raw_archive_dir archive instead of running exiftool over paths.",
+    )
+    parser.add_argument("--exiftool-version", help="Only re-derive output archived from this exiftool version.")
+    args = parser.parse_args(argv)
+    if args.rederive:
+        with open(args.output, "w", encoding="utf-8") as out:
+            summary = rederive(
+                RawArchive(args.rederive, ""),
+                out,
+                max(args.workers, 1),
+                parse_config(args.config),
+                args.exiftool_version,
+            )
+        print(json.dumps(summary, indent=2), file=sys.stderr)
+        return
+    if not args.paths and not args.file_list:
+        parser.error("supply paths to scan and/or --file-list")
+
+    plugin = AzulPluginExifTool(config=parse_config(args.config))
+    skip = load_checkpoint(args.output) if args.resume else set()
+    pipeline = None
+    if args.pipeline:
+        pipeline = ScanPipeline(plugin, args.precheck_workers, args.workers, args.post_workers, args.queue_size)
+    with open(args.output, "a" if args.resume else "w", encoding="utf-8") as out:
+        if args.resume and not ends_with_newline(args.output):
+            # terminate any partially written line left by an interrupted run
+            out.write("\n")
+        paths = iter_paths(args.paths, args.file_list)
+        summary = bulk_scan(plugin, paths, out, max(args.workers, 1), skip, pipeline)
+    if plugin.tag_stats is not None:
+        # include everything since the last periodic write
+        plugin.tag_stats.write()
+    if plugin.negative_index is not None:
+        summary["negative_index"] = plugin.negative_index.report()
+        if plugin.negative_index.path:
+            plugin.negative_index.save()
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
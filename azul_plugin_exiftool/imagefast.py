@@ -0,0 +1,368 @@
+"""Read basic metadata of simple PNG, GIF, JPEG and TIFF images without running exiftool.
+
+Produces a record shaped like one entry of `exiftool -json` output (values as json.loads would return them), so it
+goes through the same features transform. Only images made up entirely of structures and tags converted here are
+handled. Anything else, including trailers, thumbnails, colour profiles, XMP and unlisted EXIF tags, returns None
+so exiftool extracts it instead.
+"""
+
+import mmap
+import struct
+
+
+class Unsupported(Exception):
+    """The image holds something this module doesn't convert the way exiftool would."""
+
+
+ORIENTATION = {
+    1: "Horizontal (normal)",
+    2: "Mirror horizontal",
+    3: "Rotate 180",
+    4: "Mirror vertical",
+    5: "Mirror horizontal and rotate 270 CW",
+    6: "Rotate 90 CW",
+    7: "Mirror horizontal and rotate 90 CW",
+    8: "Rotate 270 CW",
+}
+RESOLUTION_UNIT = {1: "None", 2: "inches", 3: "cm"}
+COMPRESSION = {1: "Uncompressed", 5: "LZW", 7: "JPEG", 8: "Adobe Deflate", 32773: "PackBits"}
+PHOTOMETRIC = {0: "WhiteIsZero", 1: "BlackIsZero", 2: "RGB", 3: "RGB Palette", 6: "YCbCr"}
+PNG_COLOR_TYPE = {0: "Grayscale", 2: "RGB", 3: "Palette", 4: "Grayscale with Alpha", 6: "RGB with Alpha"}
+JPEG_ENCODING = {
+    0xC0: "Baseline DCT, Huffman coding",
+    0xC1: "Extended sequential DCT, Huffman coding",
+    0xC2: "Progressive DCT, Huffman coding",
+}
+# luma sampling factors, with chroma at 1 1
+YCBCR_SUBSAMPLING = {
+    (1, 1): "YCbCr4:4:4 (1 1)",
+    (2, 1): "YCbCr4:2:2 (2 1)",
+    (2, 2): "YCbCr4:2:0 (2 2)",
+    (4, 1): "YCbCr4:1:1 (4 1)",
+    (4, 2): "YCbCr4:1:0 (4 2)",
+    (1, 2): "YCbCr4:4:0 (1 2)",
+}
+BYTE_ORDER = {"<": "Little-endian (Intel, II)", ">": "Big-endian (Motorola, MM)"}
+
+# TIFF field type to (struct code, size)
+FIELD_TYPES = {1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 7: ("s", 1)}
+EXIF_POINTER = 0x8769
+
+
+def _ascii(values) -> str:
+    raw = values.rstrip(b"\x00")
+    if b"\x00" in raw or not raw.isascii() or raw != raw.strip() or any(c < 0x20 for c in raw):
+        raise Unsupported("string exiftool may reformat")
+    return raw.decode("ascii")
+
+
+def _int(values) -> int:
+    if isinstance(values, bytes) or len(values) != 1:
+        raise Unsupported("expected a single integer")
+    return values[0]
+
+
+def _ints(values) -> int | str:
+    if isinstance(values, bytes) or not values:
+        raise Unsupported("expected integers")
+    return values[0] if len(values) == 1 else " ".join(str(v) for v in values)
+
+
+def _rational(values) -> int:
+    if isinstance(values, bytes) or len(values) != 1:
+        raise Unsupported("expected a single rational")
+    num, den = values[0]
+    if not den or num % den:
+        # exiftool's float formatting isn't reproduced
+        raise Unsupported("non integer rational")
+    return num // den
+
+
+def _enum(table: dict):
+    def convert(values) -> str:
+        value = _int(values)
+        if value not in table:
+            raise Unsupported(f"unknown value {value}")
+        return table[value]
+
+    return convert
+
+
+def _version(values) -> str:
+    if not isinstance(values, bytes) or len(values) != 4 or not values.isdigit():
+        raise Unsupported("unexpected version")
+    return values.decode("ascii")
+
+
+IFD0_TAGS = {
+    0x010E: ("ImageDescription", _ascii),
+    0x010F: ("Make", _ascii),
+    0x0110: ("Model", _ascii),
+    0x0112: ("Orientation", _enum(ORIENTATION)),
+    0x011A: ("XResolution", _rational),
+    0x011B: ("YResolution", _rational),
+    0x0128: ("ResolutionUnit", _enum(RESOLUTION_UNIT)),
+    0x0131: ("Software", _ascii),
+    0x0132: ("ModifyDate", _ascii),
+    0x013B: ("Artist", _ascii),
+    0x0213: ("YCbCrPositioning", _enum({1: "Centered", 2: "Co-sited"})),
+}
+TIFF_TAGS = {
+    **IFD0_TAGS,
+    0x0100: ("ImageWidth", _int),
+    0x0101: ("ImageHeight", _int),
+    0x0102: ("BitsPerSample", _ints),
+    0x0103: ("Compression", _enum(COMPRESSION)),
+    0x0106: ("PhotometricInterpretation", _enum(PHOTOMETRIC)),
+    0x0111: ("StripOffsets", _int),
+    0x0115: ("SamplesPerPixel", _int),
+    0x0116: ("RowsPerStrip", _int),
+    0x0117: ("StripByteCounts", _int),
+    0x011C: ("PlanarConfiguration", _enum({1: "Chunky", 2: "Planar"})),
+}
+EXIF_TAGS = {
+    0x9000: ("ExifVersion", _version),
+    0x9003: ("DateTimeOriginal", _ascii),
+    0x9004: ("CreateDate", _ascii),
+    0xA001: ("ColorSpace", _enum({1: "sRGB", 2: "Adobe RGB", 0xFFFF: "Uncalibrated"})),
+    0xA002: ("ExifImageWidth", _int),
+    0xA003: ("ExifImageHeight", _int),
+}
+
+
+def _ifd(data, offset: int, endian: str, tags: dict, record: dict) -> int | None:
+    """Convert every entry of the IFD at offset into record, returning the ExifIFD offset if it has one."""
+    exif_offset = None
+    (count,) = struct.unpack_from(endian + "H", data, offset)
+    for i in range(count):
+        tag, kind, n, inline = struct.unpack_from(endian + "HHI4s", data, offset + 2 + 12 * i)
+        if kind not in FIELD_TYPES:
+            raise Unsupported(f"field type {kind}")
+        code, size = FIELD_TYPES[kind]
+        if size * n <= 4:
+            raw = inline[: size * n]
+        else:
+            (start,) = struct.unpack(endian + "I", inline)
+            if start + size * n > len(data):
+                raise Unsupported("value beyond the end of the data")
+            raw = data[start : start + size * n]
+        if code == "s":
+            values = bytes(raw)
+        else:
+            values = struct.unpack(endian + code * n, raw)
+            if kind == 5:
+                values = list(zip(values[::2], values[1::2], strict=True))
+        if tag == EXIF_POINTER and tags is not EXIF_TAGS:
+            exif_offset = _int(values)
+            continue
+        if tag not in tags:
+            raise Unsupported(f"tag {tag:#06x}")
+        name, convert = tags[tag]
+        record[name] = convert(values)
+    (next_ifd,) = struct.unpack_from(endian + "I", data, offset + 2 + 12 * count)
+    if next_ifd:
+        # a thumbnail or further pages
+        raise Unsupported("more than one IFD")
+    return exif_offset
+
+
+def _tiff_structure(data, tags: dict, record: dict):
+    """Convert a TIFF header, its IFD0 and any ExifIFD into record."""
+    endian = {b"II*\x00": "<", b"MM\x00*": ">"}.get(bytes(data[:4]))
+    if endian is None:
+        raise Unsupported("not a TIFF header")
+    record["ExifByteOrder"] = BYTE_ORDER[endian]
+    (ifd0,) = struct.unpack_from(endian + "I", data, 4)
+    exif_offset = _ifd(data, ifd0, endian, tags, record)
+    if exif_offset is not None:
+        _ifd(data, exif_offset, endian, EXIF_TAGS, record)
+
+
+def _png(mm) -> dict:
+    pos = 8
+    kinds = []
+    while True:
+        length, kind = struct.unpack_from(">I4s", mm, pos)
+        kinds.append(kind)
+        pos += 12 + length
+        if kind == b"IEND":
+            break
+    if pos != len(mm):
+        raise Unsupported("data after IEND")
+    if kinds[0] != b"IHDR" or set(kinds) - {b"IHDR", b"IDAT", b"IEND"}:
+        raise Unsupported("ancillary chunks")
+    width, height, depth, color, compression, filtering, interlace = struct.unpack_from(">IIBBBBB", mm, 16)
+    if color not in PNG_COLOR_TYPE or compression or filtering or interlace not in (0, 1):
+        raise Unsupported("unknown IHDR values")
+    return {
+        "FileType": "PNG",
+        "FileTypeExtension": "png",
+        "MIMEType": "image/png",
+        "ImageWidth": width,
+        "ImageHeight": height,
+        "BitDepth": depth,
+        "ColorType": PNG_COLOR_TYPE[color],
+        "Compression": "Deflate/Inflate",
+        "Filter": "Adaptive",
+        "Interlace": "Adam7 Interlace" if interlace else "Noninterlaced",
+    }
+
+
+def _gif(mm) -> dict:
+    width, height, flags, background, aspect = struct.unpack_from("<HHBBB", mm, 6)
+    if aspect:
+        raise Unsupported("pixel aspect ratio")
+    pos = 13 + ((3 << ((flags & 7) + 1)) if flags & 0x80 else 0)
+    images = 0
+    while mm[pos] != 0x3B:
+        if mm[pos] != 0x2C or images:
+            # extensions (animation, comments, transparency...) or more than one frame
+            raise Unsupported("extension blocks or several frames")
+        images += 1
+        (local,) = struct.unpack_from("B", mm, pos + 9)
+        pos += 10 + ((3 << ((local & 7) + 1)) if local & 0x80 else 0) + 1
+        # skip the image data sub-blocks
+        while mm[pos]:
+            pos += mm[pos] + 1
+        pos += 1
+    if pos + 1 != len(mm):
+        raise Unsupported("data after the trailer")
+    return {
+        "FileType": "GIF",
+        "FileTypeExtension": "gif",
+        "MIMEType": "image/gif",
+        "GIFVersion": bytes(mm[3:6]).decode("ascii"),
+        "ImageWidth": width,
+        "ImageHeight": height,
+        "HasColorMap": "Yes" if flags & 0x80 else "No",
+        "ColorResolutionDepth": ((flags >> 4) & 7) + 1,
+        "BitsPerPixel": (flags & 7) + 1,
+        "BackgroundColor": background,
+    }
+
+
+def _scan_end(mm, pos: int):
+    """Check the entropy-coded data from pos runs to an EOI that ends the file.
+
+    Ending in FFD9 isn't enough, as another JPEG or anything else ending in it could have been appended. A marker
+    between scans (progressive images) is also left for exiftool.
+    """
+    while True:
+        pos = mm.find(b"\xff", pos)
+        if pos < 0:
+            raise Unsupported("no EOI")
+        marker = mm[pos + 1]
+        # stuffed zero bytes, restart markers and fill bytes are part of the scan
+        if marker == 0x00 or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            pos += 1
+            continue
+        if marker != 0xD9 or pos + 2 != len(mm):
+            raise Unsupported("data after the scan")
+        return
+
+
+def _jpeg(mm) -> dict:
+    if mm[-2:] != b"\xff\xd9":
+        raise Unsupported("data after EOI")
+    record = {"FileType": "JPEG", "FileTypeExtension": "jpg", "MIMEType": "image/jpeg"}
+    pos = 2
+    jfif = exif = sof = None
+    while True:
+        if mm[pos] != 0xFF:
+            raise Unsupported("corrupt marker")
+        marker = mm[pos + 1]
+        if marker == 0xFF:
+            # fill byte
+            pos += 1
+            continue
+        if marker == 0xDA:
+            (length,) = struct.unpack_from(">H", mm, pos + 2)
+            _scan_end(mm, pos + 2 + length)
+            break
+        (length,) = struct.unpack_from(">H", mm, pos + 2)
+        segment = mm[pos + 4 : pos + 2 + length]
+        if marker == 0xE0 and segment[:5] == b"JFIF\x00" and jfif is None:
+            jfif = segment
+        elif marker == 0xE1 and segment[:6] == b"Exif\x00\x00" and exif is None:
+            exif = segment[6:]
+        elif marker in JPEG_ENCODING and sof is None:
+            sof = (marker, segment)
+        elif marker not in (0xC4, 0xDB, 0xDD):
+            # other than tables and restart intervals, eg. comments, ICC profiles, XMP or IPTC
+            raise Unsupported(f"marker {marker:#04x}")
+        pos += 2 + length
+    if sof is None or (jfif is not None and exif is not None):
+        raise Unsupported("no frame header, or both JFIF and EXIF")
+
+    if jfif is not None:
+        major, minor, units, x_density, y_density, thumb_width, thumb_height = struct.unpack_from(">BBBHHBB", jfif, 5)
+        if units not in (0, 1, 2) or thumb_width or thumb_height:
+            raise Unsupported("JFIF thumbnail or unknown units")
+        record["JFIFVersion"] = float(f"{major}.{minor:02d}")
+        record["ResolutionUnit"] = {0: "None", 1: "inches", 2: "cm"}[units]
+        record["XResolution"] = x_density
+        record["YResolution"] = y_density
+    if exif is not None:
+        _tiff_structure(exif, IFD0_TAGS, record)
+
+    marker, segment = sof
+    precision, height, width, components = struct.unpack_from(">BHHB", segment, 0)
+    sampling = [segment[7 + 3 * i] for i in range(components)]
+    if components not in (1, 3) or (components == 3 and sampling[1:] != [0x11, 0x11]):
+        raise Unsupported("component layout")
+    record["ImageWidth"] = width
+    record["ImageHeight"] = height
+    record["EncodingProcess"] = JPEG_ENCODING[marker]
+    record["BitsPerSample"] = precision
+    record["ColorComponents"] = components
+    if components == 3:
+        factors = (sampling[0] >> 4, sampling[0] & 0xF)
+        if factors not in YCBCR_SUBSAMPLING:
+            raise Unsupported("subsampling")
+        record["YCbCrSubSampling"] = YCBCR_SUBSAMPLING[factors]
+    return record
+
+
+def _tiff(mm) -> dict:
+    record = {"FileType": "TIFF", "FileTypeExtension": "tif", "MIMEType": "image/tiff"}
+    _tiff_structure(mm, TIFF_TAGS, record)
+    return record
+
+
+PARSERS = (
+    (b"\x89PNG\r\n\x1a\n", _png),
+    (b"GIF87a", _gif),
+    (b"GIF89a", _gif),
+    (b"\xff\xd8\xff", _jpeg),
+    (b"II*\x00", _tiff),
+    (b"MM\x00*", _tiff),
+)
+
+
+def parse(path: str, composite: bool = True) -> dict | None:
+    """Return an exiftool style record for a simple image, or None if exiftool should extract it.
+
+    composite adds the ImageSize and Megapixels tags exiftool derives unless run with -e.
+    """
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return None
+    with mm:
+        parser = next((p for magic, p in PARSERS if mm[: len(magic)] == magic), None)
+        if parser is None:
+            return None
+        try:
+            record = parser(mm)
+        except (Unsupported, struct.error, IndexError):
+            return None
+    if composite and "ImageWidth" in record and "ImageHeight" in record:
+        width, height = record["ImageWidth"], record["ImageHeight"]
+        megapixels = width * height / 1_000_000
+        record["ImageSize"] = f"{width}x{height}"
+        # exiftool prints 1, 3 or 6 decimal places depending on size
+        places = 1 if megapixels >= 1 else 3 if megapixels >= 0.001 else 6
+        record["Megapixels"] = float(f"{megapixels:.{places}f}")
+    return record
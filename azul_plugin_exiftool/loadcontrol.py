@@ -0,0 +1,75 @@
+"""Pick cheaper exiftool extraction modes while the plugin is under load."""
+
+import collections
+import threading
+
+# extraction modes from most to least thorough
+MODES = ("full", "fast", "fast2", "restricted")
+
+# a degraded level only steps back down once load falls this far below the threshold that triggered it
+RECOVERY_FACTOR = 0.8
+
+
+def mode_options(mode: str, restricted_tags: list[str]) -> list[str]:
+    """Return the extra exiftool options used for an extraction mode."""
+    if mode == "fast":
+        # don't scan to the end of the file looking for trailers
+        return ["-fast"]
+    if mode == "fast2":
+        # also skip maker notes
+        return ["-fast2"]
+    if mode == "restricted":
+        return ["-fast2"] + [f"-{tag}" for tag in restricted_tags]
+    return []
+
+
+class DegradationController:
+    """Track recent job latency and in-flight jobs, choosing the extraction mode for the next job.
+
+    Each threshold list holds the values at which the fast, fast2 and restricted modes take over.
+    A threshold of 0 (or an empty list) never triggers, so the default controller always picks full extraction.
+    In-flight jobs only exceed one when several threads share the plugin, as bulk scans do.
+    """
+
+    def __init__(self, latency_thresholds: list[float], inflight_thresholds: list[float], window: int = 20):
+        self.latency_thresholds = latency_thresholds[: len(MODES) - 1]
+        self.inflight_thresholds = inflight_thresholds[: len(MODES) - 1]
+        self.latencies = collections.deque(maxlen=max(window, 1))
+        self.inflight = 0
+        self.level = 0
+        self._lock = threading.Lock()
+
+    @property
+    def mode(self) -> str:
+        """The mode new jobs are currently started with."""
+        return MODES[self.level]
+
+    def _level_for(self, latency: float, inflight: int, scale: float) -> int:
+        level = 0
+        for thresholds, value in ((self.latency_thresholds, latency), (self.inflight_thresholds, inflight)):
+            for i, threshold in enumerate(thresholds):
+                if threshold and value >= threshold * scale:
+                    level = max(level, i + 1)
+        return level
+
+    def _update(self):
+        latency = sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+        level = self._level_for(latency, self.inflight, 1.0)
+        if level < self.level:
+            # hold the degraded level until load is comfortably below the threshold
+            level = min(self.level, self._level_for(latency, self.inflight, RECOVERY_FACTOR))
+        self.level = level
+
+    def begin(self) -> str:
+        """Register a job starting, returning the mode it should use."""
+        with self._lock:
+            self.inflight += 1
+            self._update()
+            return self.mode
+
+    def end(self, seconds: float):
+        """Register a job finishing after the given wall time."""
+        with self._lock:
+            self.inflight -= 1
+            self.latencies.append(seconds)
+            self._update()
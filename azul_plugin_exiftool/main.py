@@ -1,11 +1,15 @@
 """Extract metadata from many filetypes using opensource ExifTool."""
 
 import contextlib
+import dataclasses
 import datetime
 import json
+import logging
 import os
 import re
 import subprocess  # nosec B404
+import time
+from typing import Sequence
 
 from azul_runner import (
     FV,
@@ -19,6 +23,22 @@ from azul_runner import (
     cmdline_run,
 )
 
+from azul_plugin_exiftool import imagefast
+from azul_plugin_exiftool.archive import RawArchive, exiftool_version
+from azul_plugin_exiftool.loadcontrol import DegradationController, mode_options
+from azul_plugin_exiftool.negative import MALFORMED, OPT_OUT, UNKNOWN_FILE_TYPE, NegativeIndex
+from azul_plugin_exiftool.replay import ExifToolRecorder
+from azul_plugin_exiftool.scheduler import LaneScheduler, sniff_type
+from azul_plugin_exiftool.slowjobs import ScanTrace, SlowJobRecorder
+from azul_plugin_exiftool.spawn import Launcher, exiftool_env
+from azul_plugin_exiftool.stats import TagStatistics
+from azul_plugin_exiftool.warmup import warm_exiftool
+
+logger = logging.getLogger(__name__)
+
+# Empty exiftool config shipped with the plugin, passing it skips the user config lookup.
+EXIFTOOL_CONFIG = os.path.join(os.path.dirname(__file__), "exiftool.config")
+
 
 def strlist(s):
     """Given a str with a comma-separated list of values, return as list."""
@@ -68,6 +88,73 @@ MAPPED_FIELDS = {
 }
 
 
+# only extract the tags behind the mapped features (and FileType, for reporting), see run_two_pass
+MAPPED_PASS_OPTIONS = [f"-{tag}" for tag in (*MAPPED_FIELDS, "FileType")]
+
+
+# extract metadata from embedded documents (eg. timed video metadata) with tags prefixed by document number,
+# Main for the sample itself and Doc<n>[-<m>] for embedded documents
+EMBEDDED_OPTIONS = ["-ee", "-G3"]
+# an embedded document's prefix, capturing the number of the top level document it belongs to
+EMBEDDED_DOC = re.compile(r"^Doc(\d+)(?:-\d+)*$")
+
+
+@dataclasses.dataclass
+class ScanResult:
+    """Outcome of scanning a single file with exiftool.
+
+    `state` of None means the scan completed cleanly, `malformed` holds a reason when the file is malformed.
+    """
+
+    features: dict[str, list[FeatureValue] | int | str] = dataclasses.field(default_factory=dict)
+    state: State | None = None
+    malformed: str | None = None
+    mode: str = "full"
+
+
+def exiftool_command(
+    path: str, config: str = "", composite: bool = True, exiftool: str = "exiftool", options: Sequence[str] = ()
+) -> list[str]:
+    """Build the exiftool command line used to extract json metadata from path.
+
+    config is passed via -config (which exiftool requires as the first argument), empty for exiftool's default.
+    options are any extra exiftool arguments, eg. to restrict the tags extracted.
+    """
+    args = [exiftool]
+    if config:
+        args += ["-config", config]
+    if not composite:
+        # don't generate composite tags
+        args.append("-e")
+    return args + ["-json", *options, path]
+
+
+def feature_values(features: dict[str, list[FeatureValue] | int | str], name: str) -> list[FeatureValue]:
+    """Return the values of a multi-valued feature, empty if it isn't set."""
+    values = features.get(name)
+    return values if isinstance(values, list) else []
+
+
+def negative_outcome(result: ScanResult) -> tuple[str | None, str]:
+    """Return the negative index (kind, message) of a result, kind None if it isn't an opt-out or malformed."""
+    if result.malformed is not None:
+        return MALFORMED, result.malformed
+    if result.state is not None and result.state.label == State.Label.OPT_OUT:
+        if result.state.failure_name == "Unknown file type":
+            return UNKNOWN_FILE_TYPE, "Unknown file type"
+        return OPT_OUT, result.state.message or ""
+    return None, ""
+
+
+def negative_result(kind: str, message: str) -> ScanResult:
+    """Rebuild the result of a negative index entry, the inverse of negative_outcome."""
+    if kind == MALFORMED:
+        return ScanResult(malformed=message)
+    if kind == UNKNOWN_FILE_TYPE:
+        return ScanResult(state=State(State.Label.OPT_OUT, "Unknown file type"))
+    return ScanResult(state=State(State.Label.OPT_OUT, message=message))
+
+
 class AzulPluginExifTool(BinaryPlugin):
     """Extract metadata from many filetypes using opensource ExifTool."""
 
@@ -76,6 +163,95 @@ class AzulPluginExifTool(BinaryPlugin):
         filter_data_types={"content": []},
         filter_max_content_size=(int, 200 * 1024 * 1024),
         timeout=(int, 90),
+        # seconds for a first exiftool pass over just the mapped fields, so they survive the full pass timing out,
+        # 0 to only run the full pass
+        mapped_pass_timeout=(float, 0.0),
+        # smallest sample size given a mapped field pass, smaller samples rarely time out
+        mapped_pass_min_size=(int, 16 * 1024 * 1024),
+        # comma separated sample types (eg. quicktime,matroska,riff,pdf) to also extract embedded metadata from
+        embedded_types=(str, ""),
+        # seconds allowed for embedded extraction before falling back to extracting without it
+        embedded_timeout=(float, 30.0),
+        # embedded documents published per job, 0 for no limit
+        embedded_max_docs=(int, 16),
+        # maximum total bytes of exif_embedded_metadata labels and values published per job, 0 for no limit
+        embedded_max_bytes=(int, 64 * 1024),
+        # maximum number of exif_metadata values published per job, 0 for no limit
+        max_exif_values=(int, 0),
+        # maximum total bytes of exif_metadata labels and values published per job, 0 for no limit
+        max_exif_bytes=(int, 0),
+        # comma separated exif fields kept ahead of others when the exif_metadata budget is exceeded
+        exif_priority_fields=(str, ""),
+        # don't repeat mapped fields (mime, pe_*) in exif_metadata as they are published as their own features
+        compact_output=(bool, False),
+        # comma separated mean exiftool seconds over recent jobs at which the fast, fast2 and restricted
+        # extraction modes take over, empty or 0 to never degrade on latency
+        degrade_latency_thresholds=(str, ""),
+        # comma separated concurrent exiftool runs at which the fast, fast2 and restricted modes take over,
+        # bulk mode only as the runner hands the plugin one job at a time
+        degrade_inflight_thresholds=(str, ""),
+        # number of recent jobs the mean latency is taken over
+        degrade_window=(int, 20),
+        # tags (or groups as Group:all) extracted in the restricted mode, covering all the mapped fields
+        degrade_restricted_tags=(str, "File:all,EXE:all,EXIF:all"),
+        # concurrent exiftool runs allowed when scanning several files at once, 0 disables scheduling; only has an
+        # effect when more bulk workers than this contend for the slots
+        scheduler_slots=(int, 0),
+        # slots only usable by small samples so they never wait behind huge ones
+        scheduler_small_reserved=(int, 1),
+        # largest sample size scheduled in the small lane
+        scheduler_small_max_bytes=(int, 1024 * 1024),
+        # samples whose type and size have recently taken longer than this are scheduled in the large lane
+        scheduler_small_max_seconds=(float, 2.0),
+        # small samples started while a large one waits before a shared slot is held for it, 0 to never hold one
+        scheduler_small_max_streak=(int, 8),
+        # directory to record every exiftool run to as a fixture keyed by sample sha256
+        exiftool_record_dir=(str, ""),
+        # directory of recorded fixtures to replay instead of running exiftool, a missing recording is an error
+        exiftool_replay_dir=(str, ""),
+        # directory to archive raw exiftool json output to, keyed by exiftool version and sample sha256
+        raw_archive_dir=(str, ""),
+        # reuse archived output of the installed exiftool version instead of running exiftool again
+        raw_archive_lookup=(bool, False),
+        # answer repeat sightings of samples exiftool opted out of or found malformed without running exiftool
+        negative_index=(bool, False),
+        # file the negative index is loaded from at startup and periodically saved to, empty to keep it in memory
+        negative_index_path=(str, ""),
+        # number of unknown file type samples the index's bloom filter is sized for
+        negative_index_capacity=(int, 1_000_000),
+        # bloom filter false positive rate budget at capacity, each false positive wrongly opts out of a sample
+        negative_index_error_rate=(float, 0.0001),
+        # number of opt-out and malformed samples with per-sample messages remembered exactly
+        negative_index_max_messages=(int, 100_000),
+        # run exiftool anyway on every nth index hit to measure its error rate, 0 never verifies
+        negative_index_verify_every=(int, 100),
+        # number of new index entries between saves
+        negative_index_save_interval=(int, 1000),
+        # file to periodically write per file type tag frequency, length, truncation and cost statistics to
+        tag_stats_path=(str, ""),
+        # number of jobs between rewrites of the tag statistics report
+        tag_stats_interval=(int, 1000),
+        # run exiftool over a small built-in corpus at startup so the first jobs don't pay its cold start,
+        # off by default as it adds seconds to every plugin construction (tests, bench and bulk workers included)
+        warmup=(bool, False),
+        # read simple PNG, GIF, JPEG and TIFF images in process rather than running exiftool over them
+        image_fast_path=(bool, False),
+        # exiftool executable, a name looked up on PATH or a path, eg. to trial an upgraded exiftool
+        exiftool_path=(str, "exiftool"),
+        # exiftool config passed via -config, empty to let exiftool load its default config
+        exiftool_config=(str, EXIFTOOL_CONFIG),
+        # generate exiftool composite tags (eg. ImageSize, Megapixels), disabling avoids loading their modules
+        exiftool_composite=(bool, True),
+        # how exiftool is started, subprocess or posix_spawn (less overhead per run, also records its peak memory)
+        spawn_method=(str, "subprocess"),
+        # seconds a job may take before a diagnostic report is captured, 0 disables capture
+        slow_job_threshold=(float, 0.0),
+        # directory slow job reports are written to, defaults to a directory under the system temp dir
+        slow_job_dir=(str, ""),
+        # number of most recent slow job reports to keep
+        slow_job_max_reports=(int, 50),
+        # also capture a cProfile dump of the python side of slow jobs
+        slow_job_profile=(bool, False),
     )
     CONTACT = "ASD's ACSC"
     VERSION = "2025.09.30"
@@ -85,7 +261,18 @@ class AzulPluginExifTool(BinaryPlugin):
             "exif_metadata", "Metadata field extracted by exiftool, label is the field name", type=FeatureType.String
         ),
         # specifically mapped features for correlation between plugins
+        Feature(
+            "exif_embedded_metadata",
+            "Metadata field extracted by exiftool from an embedded document, label is the document and field name",
+            type=FeatureType.String,
+        ),
         Feature("mime", "Magic mime type", type=FeatureType.String),
+        Feature(
+            "exif_extraction_mode",
+            "Cheaper exiftool extraction mode used while the plugin was under load, mapped if only the mapped "
+            "fields were extracted before the full extraction timed out, or native if read without exiftool",
+            type=FeatureType.String,
+        ),
         Feature("pe_characteristics", "Characteristics as defined in the PE file header", type=FeatureType.String),
         Feature("pe_code_size", "Code size as defined in PE optional header", type=FeatureType.Integer),
         Feature("pe_comments", "Comments section from VERSIONINFO", type=FeatureType.String),
@@ -111,27 +298,337 @@ class AzulPluginExifTool(BinaryPlugin):
         ),
     ]
 
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.slow_jobs = SlowJobRecorder(
+            self.cfg.slow_job_threshold,  # ty: ignore[unresolved-attribute]
+            self.cfg.slow_job_dir,  # ty: ignore[unresolved-attribute]
+            self.cfg.slow_job_max_reports,  # ty: ignore[unresolved-attribute]
+            self.cfg.slow_job_profile,  # ty: ignore[unresolved-attribute]
+        )
+        self.load_control = DegradationController(
+            [float(x) for x in strlist(self.cfg.degrade_latency_thresholds)],  # ty: ignore[unresolved-attribute]
+            [float(x) for x in strlist(self.cfg.degrade_inflight_thresholds)],  # ty: ignore[unresolved-attribute]
+            self.cfg.degrade_window,  # ty: ignore[unresolved-attribute]
+        )
+        self.restricted_tags = strlist(self.cfg.degrade_restricted_tags)  # ty: ignore[unresolved-attribute]
+        self.embedded_types = set(strlist(self.cfg.embedded_types))  # ty: ignore[unresolved-attribute]
+        self.recorder = ExifToolRecorder(
+            self.cfg.exiftool_record_dir,  # ty: ignore[unresolved-attribute]
+            self.cfg.exiftool_replay_dir,  # ty: ignore[unresolved-attribute]
+        )
+        self.tag_stats = None
+        if self.cfg.tag_stats_path:  # ty: ignore[unresolved-attribute]
+            self.tag_stats = TagStatistics(
+                self.cfg.tag_stats_path,  # ty: ignore[unresolved-attribute]
+                self.cfg.tag_stats_interval,  # ty: ignore[unresolved-attribute]
+            )
+        self.archive = None
+        canonical = (
+            self.cfg.exiftool_config == EXIFTOOL_CONFIG  # ty: ignore[unresolved-attribute]
+            and self.cfg.exiftool_composite  # ty: ignore[unresolved-attribute]
+        )
+        if self.cfg.raw_archive_dir and not canonical:  # ty: ignore[unresolved-attribute]
+            # archived output is only keyed by exiftool version and sha256, so must all come from the same options
+            logger.warning("raw_archive_dir is ignored as exiftool_config or exiftool_composite are not the defaults")
+        elif self.cfg.raw_archive_dir:  # ty: ignore[unresolved-attribute]
+            self.archive = RawArchive(
+                self.cfg.raw_archive_dir,  # ty: ignore[unresolved-attribute]
+                exiftool_version(self.cfg.exiftool_path),  # ty: ignore[unresolved-attribute]
+            )
+        self.negative_index = None
+        if self.cfg.negative_index:  # ty: ignore[unresolved-attribute]
+            self.negative_index = NegativeIndex(
+                exiftool_version(self.cfg.exiftool_path),  # ty: ignore[unresolved-attribute]
+                self.cfg.negative_index_path,  # ty: ignore[unresolved-attribute]
+                self.cfg.negative_index_capacity,  # ty: ignore[unresolved-attribute]
+                self.cfg.negative_index_error_rate,  # ty: ignore[unresolved-attribute]
+                self.cfg.negative_index_max_messages,  # ty: ignore[unresolved-attribute]
+                self.cfg.negative_index_verify_every,  # ty: ignore[unresolved-attribute]
+                self.cfg.negative_index_save_interval,  # ty: ignore[unresolved-attribute]
+            )
+        self.scheduler = LaneScheduler(
+            self.cfg.scheduler_slots,  # ty: ignore[unresolved-attribute]
+            self.cfg.scheduler_small_reserved,  # ty: ignore[unresolved-attribute]
+            self.cfg.scheduler_small_max_bytes,  # ty: ignore[unresolved-attribute]
+            self.cfg.scheduler_small_max_seconds,  # ty: ignore[unresolved-attribute]
+            self.cfg.scheduler_small_max_streak,  # ty: ignore[unresolved-attribute]
+        )
+        # worked out once rather than for every job, each run only appends its options and the sample path
+        self.exiftool_env = exiftool_env()
+        self.exiftool_prefix = exiftool_command(
+            "",
+            self.cfg.exiftool_config,  # ty: ignore[unresolved-attribute]
+            self.cfg.exiftool_composite,  # ty: ignore[unresolved-attribute]
+            self.cfg.exiftool_path,  # ty: ignore[unresolved-attribute]
+        )[:-1]
+        if self.cfg.spawn_method not in ("subprocess", "posix_spawn"):  # ty: ignore[unresolved-attribute]
+            raise ValueError(f"unknown spawn_method {self.cfg.spawn_method}")  # ty: ignore[unresolved-attribute]
+        self.launcher = None
+        if self.cfg.spawn_method == "posix_spawn":  # ty: ignore[unresolved-attribute]
+            self.launcher = Launcher(self.exiftool_env)
+        # deferred to the first is_ready, so only processes that take jobs pay for it
+        self.warmup_report = None
+        self._warmup_pending = self.cfg.warmup and not self.recorder.replaying  # ty: ignore[unresolved-attribute]
+
+    def is_ready(self) -> bool:
+        """Warm exiftool up, if enabled, before the runner fetches the first job."""
+        self.warm_up()
+        return super().is_ready()
+
+    def warm_up(self):
+        """Run exiftool over the built-in corpus so it is at steady state, once and only if `warmup` is set."""
+        if not self._warmup_pending:
+            return
+        self._warmup_pending = False
+        try:
+            # the same options as a real job, so the same config and modules are loaded
+            self.warmup_report = warm_exiftool(self.exiftool_prefix)
+            logger.info(f"exiftool warmed up {self.warmup_report}")
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"exiftool warm up failed: {e}")
+
     def execute(self, job: Job):
         """Run exiftool on cmdline, parsing json response content into features."""
         path = job.get_data().get_filepath()
+        trace = ScanTrace(path)
+        with self.slow_jobs.watch(trace):
+            result = self.scan_path(path, trace)
+            if result.malformed is not None:
+                return self.is_malformed(result.malformed)
+            with trace.phase("publish"):
+                self.add_many_feature_values(result.features)
+            return result.state
+
+    def scan_path(self, path: str, trace: ScanTrace | None = None) -> ScanResult:
+        """Run exiftool over a local file and return the features and state it produced.
+
+        This holds no per-job state so it can be shared by the plugin and the offline bulk scanner.
+        Slow scans are captured here unless the caller supplies its own trace and watches it.
+        """
+        if trace is None:
+            trace = ScanTrace(path)
+            with self.slow_jobs.watch(trace):
+                return self.scan_path(path, trace)
+
+        result = self.precheck(path, trace)
+        if result is not None:
+            return result
+        p, mode = self.extract(path, trace)
+        return self.postprocess(p, trace, mode)
+
+    def precheck(self, path: str, trace: ScanTrace) -> ScanResult | None:
+        """Cheap checks that can settle a scan without running exiftool, returning the result if so."""
         # Check if binary is full of zeros and return malformed if so.
-        if self.is_binary_file_full_of_zeros(path):
-            return self.is_malformed("Binary is full of zeros.")
-
-        # I believe we want to force UTC as some date times are reported in local tz
-        # however, we want to ensure this doesn't override tz in fields that store their
-        # own tz info, so not sure if there's a way to force preserve that.
-        env = dict(os.environ)
-        env["TZ"] = "UTC"
-        p = subprocess.run(  # noqa: S603
-            ["exiftool", "-json", path],  # noqa: S607
-            env=env,
-            capture_output=True,
-            timeout=self.cfg.timeout,  # ty: ignore[unresolved-attribute] ty doesn't understand add_settings
+        with trace.phase("precheck"):
+            if self.is_binary_file_full_of_zeros(path):
+                return ScanResult(malformed="Binary is full of zeros.")
+
+        if self.cfg.image_fast_path:  # ty: ignore[unresolved-attribute]
+            with trace.phase("image_fast_path"):
+                record = imagefast.parse(path, self.cfg.exiftool_composite)  # ty: ignore[unresolved-attribute]
+            if record is not None:
+                with trace.phase("features"):
+                    features, truncated_field_names = self.feature_records([record])
+                return self.build_result(features, truncated_field_names, trace, "native")
+
+        if self.negative_index is not None:
+            with trace.phase("negative_index"):
+                known = self.negative_index.check(trace.sha256)
+            if known is not None:
+                return negative_result(*known)
+
+        if (
+            self.archive is not None
+            and self.cfg.raw_archive_lookup  # ty: ignore[unresolved-attribute]
+            and not (self.embedded_types and sniff_type(path) in self.embedded_types)
+        ):
+            with trace.phase("archive"):
+                stdout = self.archive.get(trace.sha256)
+            if stdout is not None:
+                # this sample has already been through this exiftool version, skip running it again
+                return self.process_output(subprocess.CompletedProcess(trace.exiftool_args, 0, stdout, b""), trace)
+        return None
+
+    def extract(self, path: str, trace: ScanTrace) -> tuple[subprocess.CompletedProcess, str]:
+        """Run exiftool over the file once the scheduler admits it, returning the run and extraction mode used."""
+        type_key = sniff_type(path) if self.scheduler.enabled or self.embedded_types else "other"
+        size = os.path.getsize(path)
+        two_pass = (
+            self.cfg.mapped_pass_timeout > 0  # ty: ignore[unresolved-attribute]
+            and size >= self.cfg.mapped_pass_min_size  # ty: ignore[unresolved-attribute]
         )
+        queued = time.perf_counter()
+        embedded = False
+        with self.scheduler.slot(type_key, size):
+            trace.timings["queued"] = time.perf_counter() - queued
+            mode = self.load_control.begin()
+            start = time.perf_counter()
+            try:
+                with trace.phase("exiftool"):
+                    if mode == "full" and type_key in self.embedded_types:
+                        embedded = True
+                        p = self.run_embedded(path, trace)
+                    elif two_pass and mode == "full":
+                        p, mode = self.run_two_pass(path, trace)
+                    else:
+                        p = self.run_exiftool(path, trace, mode_options(mode, self.restricted_tags))
+            finally:
+                self.load_control.end(time.perf_counter() - start)
+        # only the plain full extraction is archived, so lookups never return output made with other options
+        if self.archive is not None and mode == "full" and not embedded and p.returncode == 0:
+            with trace.phase("archive"):
+                self.archive.put(trace.sha256, p.stdout)
+        return p, mode
+
+    def run_embedded(self, path: str, trace: ScanTrace) -> subprocess.CompletedProcess:
+        """Extract including embedded documents, falling back to without them if that exceeds embedded_timeout."""
+        start = time.perf_counter()
+        timeout = self.cfg.timeout  # ty: ignore[unresolved-attribute]
+        try:
+            with trace.phase("embedded"):
+                return self.run_exiftool(
+                    path,
+                    trace,
+                    EMBEDDED_OPTIONS,
+                    min(self.cfg.embedded_timeout, timeout),  # ty: ignore[unresolved-attribute]
+                )
+        except subprocess.TimeoutExpired:
+            logger.info(f"embedded extraction over {path} timed out")
+        return self.run_exiftool(path, trace, timeout=max(timeout - (time.perf_counter() - start), 1))
+
+    def run_two_pass(self, path: str, trace: ScanTrace) -> tuple[subprocess.CompletedProcess, str]:
+        """Extract the mapped fields under a short timeout, then everything within the rest of the job's timeout.
+
+        returns: the full run with mode full, or the mapped field run with mode mapped if the full run timed out.
+        """
+        start = time.perf_counter()
+        timeout = self.cfg.timeout  # ty: ignore[unresolved-attribute]
+        mapped = None
+        try:
+            with trace.phase("mapped_pass"):
+                mapped = self.run_exiftool(
+                    path,
+                    trace,
+                    MAPPED_PASS_OPTIONS,
+                    min(self.cfg.mapped_pass_timeout, timeout),  # ty: ignore[unresolved-attribute]
+                )
+        except subprocess.TimeoutExpired:
+            logger.info(f"mapped field pass over {path} timed out")
+        if mapped is not None and mapped.returncode:
+            # failures such as unknown file types come from identifying the file, so the full pass would fail alike
+            return mapped, "full"
+        try:
+            return self.run_exiftool(path, trace, timeout=max(timeout - (time.perf_counter() - start), 1)), "full"
+        except subprocess.TimeoutExpired:
+            if mapped is None:
+                raise
+            return mapped, "mapped"
+
+    def postprocess(self, p: subprocess.CompletedProcess, trace: ScanTrace, mode: str) -> ScanResult:
+        """Turn the exiftool run into a result, recording its cost."""
+        result = self.process_output(p, trace, mode)
+        if self.negative_index is not None and mode == "full":
+            self.negative_index.observe(trace.sha256, *negative_outcome(result))
+        if self.tag_stats is not None:
+            self.tag_stats.observe_cost(trace.file_type, trace.timings["exiftool"])
+        return result
+
+    def process_output(
+        self, p: subprocess.CompletedProcess, trace: ScanTrace | None = None, mode: str = "full"
+    ) -> ScanResult:
+        """Turn a finished exiftool run into the features and state to publish."""
+        trace = trace or ScanTrace("")
+        failure = self.check_exiftool_failure(p)
+        if failure is not None:
+            failure.mode = mode
+            return failure
+
+        with trace.phase("decode"):
+            stdout = p.stdout.decode("utf-8")
+        with trace.phase("features"):
+            features, truncated_field_names = self.features(stdout)
+        return self.build_result(features, truncated_field_names, trace, mode)
+
+    def build_result(
+        self,
+        features: dict[str, list[FeatureValue] | int | str],
+        truncated_field_names: list[str],
+        trace: ScanTrace,
+        mode: str = "full",
+    ) -> ScanResult:
+        """Apply the output budgets to transformed features and work out the state to publish."""
+        metadata = feature_values(features, "exif_metadata")
+        trace.file_type = next((str(v.value) for v in metadata if v.label == "FileType"), "")
+        with trace.phase("budget"):
+            dropped = self.apply_exif_budget(features)
+            dropped_embedded = self.apply_embedded_budget(features)
+        if mode != "full":
+            # record that this job was extracted with a degraded mode
+            features["exif_extraction_mode"] = mode
+        result = ScanResult(features=features, mode=mode)
+        messages = []
+        if mode == "mapped":
+            messages.append("Completed but only the mapped fields were extracted as the full extraction timed out")
+        if len(truncated_field_names) > 0:
+            messages.append(f"Completed but the following fields were truncated {','.join(truncated_field_names)}")
+        if dropped > 0:
+            messages.append(f"Completed but {dropped} exif_metadata values were dropped to fit the per-job budget")
+        if dropped_embedded > 0:
+            messages.append(
+                f"Completed but {dropped_embedded} exif_embedded_metadata values were dropped to fit the "
+                "embedded document limits"
+            )
+        if messages:
+            result.state = State(State.Label.COMPLETED_WITH_ERRORS, message="\n".join(messages))
+        return result
+
+    def run_exiftool(
+        self,
+        path: str,
+        trace: ScanTrace | None = None,
+        options: Sequence[str] = (),
+        timeout: float | None = None,
+    ) -> subprocess.CompletedProcess:
+        """Spawn exiftool over the file, capturing its json output.
+
+        timeout defaults to the configured job timeout.
+        """
+        args = [*self.exiftool_prefix, *options, path]
+        trace = trace or ScanTrace(path)
+        trace.exiftool_args = args
+        if timeout is None:
+            timeout = self.cfg.timeout  # ty: ignore[unresolved-attribute] ty doesn't understand add_settings
+        sha256 = trace.sha256 if self.recorder.recording or self.recorder.replaying else ""
+        try:
+            if self.recorder.replaying:
+                p = self.recorder.replay(sha256, args, path, timeout)
+            elif self.launcher is not None:
+                p, usage = self.launcher.run(args, timeout)
+                trace.exiftool_maxrss_kb = usage.ru_maxrss
+            else:
+                p = subprocess.run(  # noqa: S603
+                    args,
+                    env=self.exiftool_env,
+                    capture_output=True,
+                    timeout=timeout,
+                )
+        except subprocess.TimeoutExpired as e:
+            trace.exiftool_stderr = e.stderr or b""
+            if self.recorder.recording:
+                self.recorder.record(sha256, args, path, None, e.output or b"", e.stderr or b"", timed_out=True)
+            raise
+        trace.exiftool_returncode = p.returncode
+        trace.exiftool_stderr = p.stderr
+        if self.recorder.recording:
+            self.recorder.record(sha256, args, path, p.returncode, p.stdout, p.stderr)
+        return p
+
+    def check_exiftool_failure(self, p: subprocess.CompletedProcess) -> ScanResult | None:
+        """Map a failed exiftool run onto the result to report, or None if exiftool succeeded."""
         if p.returncode and b"Unknown file type" in p.stdout:
             # exiftool treats unknown types as error
-            return State(State.Label.OPT_OUT, "Unknown file type")
+            return ScanResult(state=State(State.Label.OPT_OUT, "Unknown file type"))
         elif p.returncode:
             # raise anything else as processing error
             err_msg = p.stderr.decode("utf-8")
@@ -148,41 +645,65 @@ class AzulPluginExifTool(BinaryPlugin):
                         err_msg = "\n".join(final_message)
             # Entire file is a single binary character and is therefore malformed.
             if err_msg.startswith("Entire file is binary"):
-                return self.is_malformed(err_msg)
+                return ScanResult(malformed=err_msg)
 
             if re.match("First [0-9].* of file is binary (zeros|0x..'s)", err_msg):
-                return State(State.Label.OPT_OUT, message=err_msg)
-            return State(
-                State.Label.ERROR_EXCEPTION,
-                message=err_msg,
-            )
-
-        features, truncated_field_names = self.features(p.stdout.decode("utf-8"))
-        self.add_many_feature_values(features)
-        if len(truncated_field_names) > 0:
-            return State(
-                State.Label.COMPLETED_WITH_ERRORS,
-                message=f"Completed but the following fields were truncated {','.join(truncated_field_names)}",
+                return ScanResult(state=State(State.Label.OPT_OUT, message=err_msg))
+            return ScanResult(
+                state=State(
+                    State.Label.ERROR_EXCEPTION,
+                    message=err_msg,
+                )
             )
+        return None
 
     def features(self, jsonstring) -> tuple[dict[str, list[FeatureValue] | int | str], list[str]]:
         """Given exiftool output in json format, transform into a features dict.
 
+        returns: a dictionary of features to add and a boolean indicating if any values were truncated.
+        """
+        return self.feature_records(json.loads(jsonstring))
+
+    def feature_records(self, records: list[dict]) -> tuple[dict[str, list[FeatureValue] | int | str], list[str]]:
+        """Transform parsed exiftool json output, one record per file, into a features dict.
+
         returns: a dictionary of features to add and a boolean indicating if any values were truncated.
         """
         features: dict[str, list[FeatureValue] | int | str] = {}
         truncated_field_names = []
+        compact = self.cfg.compact_output  # ty: ignore[unresolved-attribute]
+        file_type = ""
+        observed = [] if self.tag_stats is not None else None
         # returns a list of dicts containing key:value metadata attributes
         # May be future issues with field name collisions.
-        for j in json.loads(jsonstring):
+        for j in records:
+            file_type = file_type or str(j.get("FileType", j.get("Main:FileType", "")))
             for field, val in j.items():
+                doc = "Main"
+                if ":" in field:
+                    prefix, name = field.split(":", 1)
+                    if prefix == "Main" or EMBEDDED_DOC.match(prefix):
+                        # extracted with EMBEDDED_OPTIONS, so prefixed by the document the tag came from
+                        doc, field = prefix, name
+                embedded = doc != "Main"
                 if val in ("(none)", ""):  # allow 0 as valid int
                     continue
                 if field in IGNORED_FIELDS:
                     continue
-                if field in MAPPED_FIELDS:
+                if (
+                    observed is not None
+                    and not embedded
+                    and isinstance(val, (int, float, str, datetime.datetime, bytes))
+                ):
+                    length = len(val) if isinstance(val, (str, bytes)) else len(str(val))
+                    too_long = isinstance(val, (str, bytes)) and length > self.cfg.max_value_length
+                    observed.append((field, length, too_long))
+                if field in MAPPED_FIELDS and not embedded:
                     name, f = MAPPED_FIELDS[field]
                     features[name] = f(val)
+                    if compact:
+                        # already published as its own feature
+                        continue
                 if not isinstance(val, (int, float, str, datetime.datetime, bytes)):
                     # skip bad output
                     continue
@@ -190,20 +711,92 @@ class AzulPluginExifTool(BinaryPlugin):
                     if field in IGNORED_FIELDS_WHEN_TOO_LONG:
                         continue
                     else:
-                        truncated_field_names.append(field)
+                        truncated_field_names.append(f"{doc}:{field}" if embedded else field)
                         val = val[: self.cfg.max_value_length]
+                if embedded:
+                    # kept apart so embedded documents can't crowd out or be mistaken for the sample's own metadata
+                    features.setdefault("exif_embedded_metadata", []).append(FV(str(val), label=f"{doc}:{field}"))  # ty: ignore[unresolved-attribute]
+                    continue
                 # regardless, always set the generic feature
                 features.setdefault("exif_metadata", []).append(FV(str(val), label=field))  # ty: ignore[unresolved-attribute] ty thinks exif_metadata could still be str or int
+        if observed is not None and self.tag_stats is not None:
+            self.tag_stats.observe(file_type, observed)
         return features, truncated_field_names
 
+    def apply_exif_budget(self, features: dict[str, list[FeatureValue] | int | str]) -> int:
+        """Trim exif_metadata in place to the configured value count and byte budget.
+
+        Values are kept in priority order: mapped fields, then the configured priority fields, then everything else.
+        returns: the number of values dropped.
+        """
+        max_values = self.cfg.max_exif_values  # ty: ignore[unresolved-attribute]
+        max_bytes = self.cfg.max_exif_bytes  # ty: ignore[unresolved-attribute]
+        values = feature_values(features, "exif_metadata")
+        if not values or (not max_values and not max_bytes):
+            return 0
+        priority_fields = strlist(self.cfg.exif_priority_fields)  # ty: ignore[unresolved-attribute]
+
+        def priority(item):
+            i, fv = item
+            if fv.label in MAPPED_FIELDS:
+                return (0, i)
+            if fv.label in priority_fields:
+                return (1, priority_fields.index(fv.label), i)
+            return (2, i)
+
+        kept = []
+        used_bytes = 0
+        for i, fv in sorted(enumerate(values), key=priority):
+            if max_values and len(kept) >= max_values:
+                break
+            size = len((fv.label or "").encode("utf-8")) + len(str(fv.value).encode("utf-8"))
+            if max_bytes and used_bytes + size > max_bytes:
+                # a later, smaller value may still fit
+                continue
+            kept.append((i, fv))
+            used_bytes += size
+        # publish in the original order
+        features["exif_metadata"] = [fv for _, fv in sorted(kept, key=lambda x: x[0])]
+        return len(values) - len(kept)
+
+    def apply_embedded_budget(self, features: dict[str, list[FeatureValue] | int | str]) -> int:
+        """Trim exif_embedded_metadata in place to the configured document count and byte budget.
+
+        returns: the number of values dropped.
+        """
+        max_docs = self.cfg.embedded_max_docs  # ty: ignore[unresolved-attribute]
+        max_bytes = self.cfg.embedded_max_bytes  # ty: ignore[unresolved-attribute]
+        values = feature_values(features, "exif_embedded_metadata")
+        if not values or (not max_docs and not max_bytes):
+            return 0
+        kept = []
+        used_bytes = 0
+        for fv in values:
+            label = fv.label or ""
+            doc = EMBEDDED_DOC.match(label.split(":", 1)[0])
+            if doc is None:
+                # not from a document numbered by -G3, so it can't be placed against max_docs
+                continue
+            if max_docs and int(doc.group(1)) > max_docs:
+                continue
+            size = len(label.encode("utf-8")) + len(str(fv.value).encode("utf-8"))
+            if max_bytes and used_bytes + size > max_bytes:
+                continue
+            kept.append(fv)
+            used_bytes += size
+        if kept:
+            features["exif_embedded_metadata"] = kept
+        else:
+            del features["exif_embedded_metadata"]
+        return len(values) - len(kept)
+
     def is_binary_file_full_of_zeros(self, file_path):
         """Scan file for zeros."""
         with open(file_path, "rb") as file:
-            byte = file.read(1)
-            while byte:
-                if byte != b"\x00":
+            # read in blocks, byte at a time reads take minutes over the largest allowed files
+            while block := file.read(64 * 1024):
+                if block.count(0) != len(block):
                     return False
-                byte = file.read(1)
         return True
 
 
@@ -0,0 +1,245 @@
+"""Remember samples that exiftool opted out of or found malformed, so repeat sightings skip exiftool.
+
+Samples exiftool doesn't recognise are held in a bloom filter over their sha256, which stays small however many
+are seen at the cost of a configurable false positive rate. Outcomes whose message varies per sample (eg. the
+number of leading zero bytes) are kept exactly in a bounded table. Every so often a hit is run through exiftool
+anyway to measure how often the index is wrong. Bloom filter entries can't be removed, so samples found to be
+false positives are kept in an exception table consulted first. Instances saving to the same path merge their
+entries with what is already saved.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+
+from azul_plugin_exiftool.util import file_lock, replace_file
+
+logger = logging.getLogger(__name__)
+
+# identifies the first line of a saved index
+INDEX_FORMAT = "azul-plugin-exiftool-negative-index"
+INDEX_FORMAT_VERSION = 1
+
+# outcome kinds, the one with a fixed message is answered by the bloom filter
+UNKNOWN_FILE_TYPE = "unknown_file_type"
+OPT_OUT = "opt_out"
+MALFORMED = "malformed"
+
+
+class BloomFilter:
+    """Set membership over sha256 hex digests, with false positives at about error_rate up to capacity entries."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        bits = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size = max(64, (bits + 7) // 8 * 8)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray(self.size // 8)
+        self.count = 0
+
+    def _positions(self, sha256: str):
+        # the digest is already uniformly distributed, so two slices of it give the double hashing seeds
+        h1 = int(sha256[:16], 16)
+        h2 = int(sha256[16:32], 16) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def __contains__(self, sha256: str) -> bool:
+        """Whether the digest was probably added, never False for one that was."""
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(sha256))
+
+    def add(self, sha256: str) -> bool:
+        """Add a digest, returning False if it (or a collision) was already present."""
+        added = False
+        for p in self._positions(sha256):
+            if not self.bits[p >> 3] & (1 << (p & 7)):
+                self.bits[p >> 3] |= 1 << (p & 7)
+                added = True
+        self.count += added
+        return added
+
+    def union(self, bits: bytes, count: int):
+        """Add every entry of another filter of the same size, given its bits and how many entries it holds."""
+        merged = int.from_bytes(self.bits, "little") | int.from_bytes(bits, "little")
+        self.bits = bytearray(merged.to_bytes(len(self.bits), "little"))
+        # entries both filters hold would be counted twice, so estimate the total from the bits set
+        fill = merged.bit_count() / self.size
+        estimate = self.capacity if fill >= 1 else round(-self.size / self.hashes * math.log(1 - fill))
+        self.count = max(self.count, count, estimate)
+
+    @property
+    def saturated(self) -> bool:
+        """Whether adding more would push the false positive rate above error_rate."""
+        return self.count >= self.capacity
+
+    def expected_error_rate(self) -> float:
+        """The false positive rate for the number of entries added so far."""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class NegativeIndex:
+    """Known opt-out and malformed outcomes by sample sha256, optionally saved to `path`.
+
+    The saved index is only loaded if it was built with the same exiftool version.
+    Every `verify_every` hits one is not answered from the index, so the caller runs exiftool and reports
+    the real outcome through `observe`, 0 never verifies.
+    """
+
+    def __init__(
+        self,
+        exiftool_version: str,
+        path: str = "",
+        capacity: int = 1_000_000,
+        error_rate: float = 0.0001,
+        max_messages: int = 100_000,
+        verify_every: int = 100,
+        save_interval: int = 1000,
+    ):
+        self.exiftool_version = exiftool_version
+        self.path = path
+        self.max_messages = max_messages
+        self.verify_every = verify_every
+        self.save_interval = max(save_interval, 1)
+        self.filter = BloomFilter(capacity, error_rate)
+        # sha256 to (kind, message) for outcomes that vary per sample, oldest first
+        self.messages: dict[str, tuple[str, str]] = {}
+        # sha256 of samples verification found the filter wrongly matches
+        self.exceptions: set[str] = set()
+        self.hits = 0
+        self.verified = 0
+        self.false_positives = 0
+        self._pending: dict[str, tuple[str, str]] = {}
+        self._since_save = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def check(self, sha256: str) -> tuple[str, str] | None:
+        """Return the known (kind, message) outcome of a sample, or None if exiftool should run."""
+        with self._lock:
+            if sha256 in self.exceptions:
+                return None
+            known = self.messages.get(sha256)
+            if known is None and sha256 in self.filter:
+                known = (UNKNOWN_FILE_TYPE, "Unknown file type")
+            if known is None:
+                return None
+            self.hits += 1
+            if self.verify_every and self.hits % self.verify_every == 0:
+                # let this one through to exiftool and compare once it finishes
+                if len(self._pending) >= 1000:
+                    self._pending.pop(next(iter(self._pending)))
+                self._pending[sha256] = known
+                return None
+            return known
+
+    def observe(self, sha256: str, kind: str | None, message: str = ""):
+        """Record the outcome of running exiftool over a sample, kind None unless it opted out or was malformed."""
+        with self._lock:
+            expected = self._pending.pop(sha256, None)
+            if expected is not None:
+                self.verified += 1
+                if expected != (kind, message):
+                    self.false_positives += 1
+                    self.messages.pop(sha256, None)
+                    # the filter, or an index saved elsewhere, would keep matching this sample, so answer it from
+                    # exiftool from now on
+                    self.exceptions.add(sha256)
+                    logger.warning(f"negative index had {expected} for {sha256} but exiftool gave {(kind, message)}")
+            if kind is None:
+                return
+            if kind == UNKNOWN_FILE_TYPE:
+                if self.filter.saturated or not self.filter.add(sha256):
+                    return
+            else:
+                if sha256 in self.messages:
+                    return
+                if len(self.messages) >= self.max_messages:
+                    self.messages.pop(next(iter(self.messages)))
+                self.messages[sha256] = (kind, message)
+            self._since_save += 1
+            due = self.path and self._since_save >= self.save_interval
+            if due:
+                self._since_save = 0
+        if due:
+            self.save()
+
+    def report(self) -> dict:
+        """Summarise the size and measured accuracy of the index."""
+        with self._lock:
+            return {
+                "filter_entries": self.filter.count,
+                "filter_bytes": len(self.filter.bits),
+                "filter_saturated": self.filter.saturated,
+                "expected_error_rate": self.filter.expected_error_rate(),
+                "message_entries": len(self.messages),
+                "exception_entries": len(self.exceptions),
+                "hits": self.hits,
+                "verified": self.verified,
+                "false_positives": self.false_positives,
+                "observed_error_rate": self.false_positives / self.verified if self.verified else None,
+            }
+
+    def save(self, path: str | None = None):
+        """Merge in any index saved at `path`, then replace it with a json header line followed by the filter bits.
+
+        Failures are logged rather than raised, so saving the index never fails a scan.
+        """
+        path = path or self.path
+        with self._lock:
+            try:
+                with file_lock(path):
+                    if os.path.exists(path):
+                        try:
+                            saved = self._read(path)
+                        except ValueError as e:
+                            logger.warning(f"replacing unreadable negative index at {path}: {e}")
+                            saved = None
+                        if saved is not None:
+                            self._merge(*saved)
+                    header = {
+                        "format": INDEX_FORMAT,
+                        "format_version": INDEX_FORMAT_VERSION,
+                        "exiftool_version": self.exiftool_version,
+                        "capacity": self.filter.capacity,
+                        "error_rate": self.filter.error_rate,
+                        "filter_entries": self.filter.count,
+                        "messages": self.messages,
+                        "exceptions": sorted(self.exceptions),
+                    }
+                    replace_file(path, json.dumps(header).encode("utf-8") + b"\n" + bytes(self.filter.bits))
+            except OSError as e:
+                logger.warning(f"failed to save negative index to {path}: {e}")
+
+    def load(self, path: str):
+        """Merge in an index saved by `save`, unless it is from a different exiftool version or size."""
+        saved = self._read(path)
+        if saved is not None:
+            with self._lock:
+                self._merge(*saved)
+
+    def _read(self, path: str) -> tuple[dict, bytes] | None:
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            bits = f.read()
+        if header.get("format") != INDEX_FORMAT or header.get("format_version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a saved negative index (header {header})")
+        if header["exiftool_version"] != self.exiftool_version:
+            logger.info(f"ignoring negative index from exiftool {header['exiftool_version']}")
+            return None
+        if len(bits) != len(self.filter.bits):
+            logger.info("ignoring negative index saved with a different capacity or error rate")
+            return None
+        return header, bits
+
+    def _merge(self, header: dict, bits: bytes):
+        # the caller holds the lock
+        self.filter.union(bits, header["filter_entries"])
+        self.exceptions.update(header.get("exceptions", []))
+        messages = {sha256: (kind, message) for sha256, (kind, message) in header["messages"].items()}
+        messages.update(self.messages)
+        # keep the newest entries if max_messages has since been lowered
+        entries = [(sha256, known) for sha256, known in messages.items() if sha256 not in self.exceptions]
+        self.messages = dict(entries[-self.max_messages :] if self.max_messages else [])
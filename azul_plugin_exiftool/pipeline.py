@@ -0,0 +1,175 @@
+"""Staged scanning so prechecks, exiftool runs and post-processing of different files overlap.
+
+Each stage has its own pool of threads, joined by bounded queues so a slow stage applies back pressure rather
+than letting work pile up in memory. Per-stage utilisation shows which stage is the bottleneck.
+"""
+
+import contextlib
+import queue
+import subprocess  # nosec B404
+import threading
+import time
+from typing import Callable, Iterable
+
+from azul_runner import State
+
+from azul_plugin_exiftool.main import AzulPluginExifTool, ScanResult
+from azul_plugin_exiftool.slowjobs import ScanTrace
+
+# marks the end of the input to a stage
+_DONE = object()
+
+
+class PipelineItem:
+    """A file moving through the pipeline."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.trace = ScanTrace(path)
+        self.started = time.perf_counter()
+        self.process: subprocess.CompletedProcess | None = None
+        self.mode = "full"
+        self.result: ScanResult | None = None
+
+
+class Stage:
+    """A pool of threads applying func to items from inbox and passing them on to outbox."""
+
+    def __init__(self, name: str, workers: int, func: Callable[[PipelineItem], None], inbox, outbox):
+        self.name = name
+        self.workers = max(workers, 1)
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.starved_seconds = 0.0
+        self.blocked_seconds = 0.0
+        # number of end markers to pass on, one per worker of the following stage
+        self.next_workers = 1
+        self._lock = threading.Lock()
+        self._finished = 0
+        self.threads = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True) for i in range(self.workers)
+        ]
+
+    def start(self):
+        """Start the stage's threads."""
+        for t in self.threads:
+            t.start()
+
+    def _work(self):
+        while True:
+            waiting = time.perf_counter()
+            item = self.inbox.get()
+            got = time.perf_counter()
+            if item is _DONE:
+                with self._lock:
+                    self.starved_seconds += got - waiting
+                    self._finished += 1
+                    last = self._finished == self.workers
+                if last:
+                    # every worker of this stage is done, so the next stage can finish too
+                    for _ in range(self.next_workers):
+                        self.outbox.put(_DONE)
+                return
+            # items already settled by an earlier stage pass straight through
+            processed = item.result is None
+            if processed:
+                try:
+                    self.func(item)
+                except Exception as e:
+                    item.result = ScanResult(
+                        state=State(State.Label.ERROR_EXCEPTION, message=f"{type(e).__name__}: {e}")
+                    )
+            done = time.perf_counter()
+            self.outbox.put(item)
+            with self._lock:
+                self.items += processed
+                self.starved_seconds += got - waiting
+                self.busy_seconds += done - got
+                self.blocked_seconds += time.perf_counter() - done
+
+    def report(self, elapsed: float) -> dict:
+        """Summarise the stage, utilisation near 1 marks the bottleneck."""
+        capacity = self.workers * elapsed
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "utilisation": round(self.busy_seconds / capacity, 4) if capacity else 0.0,
+            "starved_fraction": round(self.starved_seconds / capacity, 4) if capacity else 0.0,
+            "blocked_fraction": round(self.blocked_seconds / capacity, 4) if capacity else 0.0,
+            "mean_busy_seconds": round(self.busy_seconds / self.items, 6) if self.items else 0.0,
+        }
+
+
+class ScanPipeline:
+    """Scan files in three concurrent stages: precheck (file I/O), exiftool (subprocesses) and post-processing."""
+
+    def __init__(
+        self,
+        plugin: AzulPluginExifTool,
+        precheck_workers: int = 2,
+        exiftool_workers: int = 4,
+        post_workers: int = 2,
+        queue_size: int = 64,
+    ):
+        self.plugin = plugin
+        self.queues = [queue.Queue(maxsize=max(queue_size, 1)) for _ in range(4)]
+        self.stages = [
+            Stage("precheck", precheck_workers, self._precheck, self.queues[0], self.queues[1]),
+            Stage("exiftool", exiftool_workers, self._extract, self.queues[1], self.queues[2]),
+            Stage("post", post_workers, self._post, self.queues[2], self.queues[3]),
+        ]
+        for stage, following in zip(self.stages, [*self.stages[1:], None], strict=True):
+            stage.next_workers = following.workers if following else 1
+
+    def _precheck(self, item: PipelineItem):
+        item.result = self.plugin.precheck(item.path, item.trace)
+
+    def _extract(self, item: PipelineItem):
+        item.process, item.mode = self.plugin.extract(item.path, item.trace)
+
+    def _post(self, item: PipelineItem):
+        if item.process is None:
+            raise RuntimeError(f"{item.path} reached post-processing without an exiftool run")
+        item.result = self.plugin.postprocess(item.process, item.trace, item.mode)
+
+    def run(self, paths: Iterable[str], on_result: Callable[[PipelineItem, float], None]) -> dict:
+        """Scan every path, calling on_result(item, seconds) from this thread as each file finishes.
+
+        Returns per-stage metrics. An exception raised while iterating paths is re-raised once the files already
+        fed in have finished.
+        """
+        start = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+
+        feed_errors = []
+
+        def feed():
+            try:
+                for path in paths:
+                    self.queues[0].put(PipelineItem(path))
+            except BaseException as e:
+                # handed to the consuming thread, otherwise the run would just end early
+                feed_errors.append(e)
+            finally:
+                for _ in range(self.stages[0].workers):
+                    self.queues[0].put(_DONE)
+
+        feeder = threading.Thread(target=feed, name="feed", daemon=True)
+        feeder.start()
+        slow_jobs = self.plugin.slow_jobs
+        while (item := self.queues[3].get()) is not _DONE:
+            seconds = time.perf_counter() - item.started
+            if slow_jobs.enabled and seconds >= slow_jobs.threshold:
+                # stages run on different threads so the job can't be watched as a single block
+                with contextlib.suppress(OSError):
+                    slow_jobs.record(item.trace, seconds, None, None)
+            on_result(item, seconds)
+        feeder.join()
+        if feed_errors:
+            raise feed_errors[0]
+        elapsed = time.perf_counter() - start
+        return {"seconds": round(elapsed, 3), "stages": {s.name: s.report(elapsed) for s in self.stages}}
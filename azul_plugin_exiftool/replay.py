@@ -0,0 +1,130 @@
+"""Record exiftool runs as fixtures and replay them in place of the subprocess.
+
+Fixtures are keyed by sample sha256 so benchmarks and tests give the same output regardless of the installed
+exiftool version, and without the cost of spawning it.
+"""
+
+import base64
+import json
+import os
+import subprocess  # nosec B404
+import threading
+
+# stands in for the sample path in recorded argv, which differs between runs
+SAMPLE_PLACEHOLDER = "{sample}"
+
+
+class ReplayMissError(LookupError):
+    """No recording exists for the sample and exiftool arguments being replayed."""
+
+
+def normalise_args(args: list[str], path: str) -> list[str]:
+    """Make argv comparable between machines and runs.
+
+    The sample path is replaced by a placeholder and the exiftool binary and -config file by their base names.
+    """
+    out = []
+    for i, arg in enumerate(args):
+        if arg == path:
+            arg = SAMPLE_PLACEHOLDER
+        elif i == 0 or (i > 0 and args[i - 1] == "-config"):
+            arg = os.path.basename(arg)
+        out.append(arg)
+    return out
+
+
+class ExifToolRecorder:
+    """Save exiftool runs to `record_dir` and/or substitute runs saved in `replay_dir`.
+
+    Each sample has one fixture file holding every distinct argv it was run with.
+    """
+
+    def __init__(self, record_dir: str = "", replay_dir: str = ""):
+        self.record_dir = record_dir
+        self.replay_dir = replay_dir
+        self._lock = threading.Lock()
+
+    @property
+    def recording(self) -> bool:
+        """Whether runs are being recorded."""
+        return bool(self.record_dir)
+
+    @property
+    def replaying(self) -> bool:
+        """Whether runs are being replayed."""
+        return bool(self.replay_dir)
+
+    @staticmethod
+    def fixture_path(directory: str, sha256: str) -> str:
+        """Return the fixture file for a sample."""
+        return os.path.join(directory, f"{sha256}.json")
+
+    @staticmethod
+    def load(directory: str, sha256: str) -> dict:
+        """Load a sample's fixture, empty if none has been recorded."""
+        try:
+            with open(ExifToolRecorder.fixture_path(directory, sha256)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"sha256": sha256, "runs": []}
+
+    def replay(self, sha256: str, args: list[str], path: str, timeout: float) -> subprocess.CompletedProcess:
+        """Return the recorded result of running args over the sample.
+
+        Raises TimeoutExpired if the recorded run timed out and ReplayMissError if there is no recording.
+        """
+        normalised = normalise_args(args, path)
+        for run in self.load(self.replay_dir, sha256)["runs"]:
+            if run["args"] != normalised:
+                continue
+            stdout = base64.b64decode(run["stdout"])
+            stderr = base64.b64decode(run["stderr"])
+            if run.get("timed_out"):
+                raise subprocess.TimeoutExpired(args, timeout, output=stdout, stderr=stderr)
+            return subprocess.CompletedProcess(args, run["returncode"], stdout, stderr)
+        raise ReplayMissError(f"no recorded exiftool run of {normalised} for {sha256}")
+
+    def record(
+        self,
+        sha256: str,
+        args: list[str],
+        path: str,
+        returncode: int | None,
+        stdout: bytes,
+        stderr: bytes,
+        timed_out: bool = False,
+    ):
+        """Save a run, replacing any previous recording with the same arguments."""
+        normalised = normalise_args(args, path)
+        run = {
+            "args": normalised,
+            "returncode": returncode,
+            "stdout": base64.b64encode(stdout or b"").decode(),
+            "stderr": base64.b64encode(stderr or b"").decode(),
+            "timed_out": timed_out,
+        }
+        with self._lock:
+            os.makedirs(self.record_dir, exist_ok=True)
+            fixture = self.load(self.record_dir, sha256)
+            fixture["runs"] = [r for r in fixture["runs"] if r["args"] != normalised] + [run]
+            tmp = self.fixture_path(self.record_dir, sha256) + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(fixture, f, indent=2)
+            os.replace(tmp, self.fixture_path(self.record_dir, sha256))
+
+
+def recorded_runs(directory: str):
+    """Yield the sha256 and CompletedProcess of every recorded run that finished, across a fixture directory."""
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        fixture = ExifToolRecorder.load(directory, name[: -len(".json")])
+        for run in fixture["runs"]:
+            if run.get("timed_out"):
+                continue
+            yield (
+                fixture["sha256"],
+                subprocess.CompletedProcess(
+                    run["args"], run["returncode"], base64.b64decode(run["stdout"]), base64.b64decode(run["stderr"])
+                ),
+            )
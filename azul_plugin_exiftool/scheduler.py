@@ -0,0 +1,172 @@
+"""Size-aware admission of exiftool runs so small samples aren't stuck behind huge ones."""
+
+import contextlib
+import math
+import threading
+import time
+from typing import Iterator
+
+SMALL = "small"
+LARGE = "large"
+
+# weight given to the newest observation in the per type cost averages
+EWMA_ALPHA = 0.2
+
+# leading bytes used to give a sample a coarse type before exiftool has identified it
+SIGNATURES = (
+    (b"MZ", "pe"),
+    (b"\x7fELF", "elf"),
+    (b"%PDF", "pdf"),
+    (b"PK\x03\x04", "zip"),
+    (b"\xd0\xcf\x11\xe0", "ole"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG", "png"),
+    (b"GIF8", "gif"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"RIFF", "riff"),
+    (b"\x1a\x45\xdf\xa3", "matroska"),
+    (b"Rar!", "rar"),
+    (b"7z\xbc\xaf", "7z"),
+)
+
+
+def sniff_type(path: str) -> str:
+    """Return a coarse type for a file from its leading bytes."""
+    with open(path, "rb") as f:
+        head = f.read(12)
+    if head[4:8] in (b"ftyp", b"moov", b"mdat"):
+        return "quicktime"
+    for magic, name in SIGNATURES:
+        if head.startswith(magic):
+            return name
+    return "other"
+
+
+def size_bucket(size: int) -> int:
+    """Group sizes into buckets growing by powers of 4 from 64KiB, so costs are learned per order of magnitude."""
+    return max(0, math.ceil(math.log(max(size, 1) / 65536, 4)))
+
+
+class LaneStats:
+    """Queue wait and run time totals for one lane."""
+
+    def __init__(self):
+        self.jobs = 0
+        self.waiting = 0
+        self.running = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def report(self, elapsed: float) -> dict:
+        """Summarise the lane."""
+        return {
+            "jobs": self.jobs,
+            "waiting": self.waiting,
+            "running": self.running,
+            "mean_wait_seconds": round(self.wait_seconds / self.jobs, 6) if self.jobs else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 6),
+            "mean_run_seconds": round(self.run_seconds / self.jobs, 6) if self.jobs else 0.0,
+            "jobs_per_second": round(self.jobs / elapsed, 3) if elapsed else 0.0,
+        }
+
+
+class LaneScheduler:
+    """Limit concurrent exiftool runs to `slots`, with `small_reserved` of them only usable by the small lane.
+
+    A sample goes to the small lane when it is at most `small_max_bytes` and samples of its type and size have
+    recently taken at most `small_max_seconds`. With 0 slots the scheduler admits everything immediately.
+    Once `small_max_streak` small samples have started while a large one waits, small samples are kept to the
+    reserved slots until the large one gets a shared slot, so a steady stream of small samples can't starve it.
+    """
+
+    def __init__(
+        self,
+        slots: int = 0,
+        small_reserved: int = 1,
+        small_max_bytes: int = 1024 * 1024,
+        small_max_seconds=2.0,
+        small_max_streak: int = 8,
+    ):
+        self.slots = slots
+        self.small_reserved = min(small_reserved, max(slots - 1, 0))
+        self.small_max_bytes = small_max_bytes
+        self.small_max_seconds = small_max_seconds
+        self.small_max_streak = small_max_streak
+        # small samples started since a large one last started, while one was waiting
+        self.small_streak = 0
+        self.costs: dict[tuple[str, int], float] = {}
+        self.lanes = {SMALL: LaneStats(), LARGE: LaneStats()}
+        self.started = time.monotonic()
+        self._cond = threading.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether runs are being scheduled."""
+        return self.slots > 0
+
+    def predicted_seconds(self, type_key: str, size: int) -> float | None:
+        """Return the learned cost for samples of this type and size, if any have been seen."""
+        return self.costs.get((type_key, size_bucket(size)))
+
+    def classify(self, type_key: str, size: int) -> str:
+        """Return the lane a sample is scheduled in."""
+        if size > self.small_max_bytes:
+            return LARGE
+        predicted = self.predicted_seconds(type_key, size)
+        if predicted is not None and predicted > self.small_max_seconds:
+            return LARGE
+        return SMALL
+
+    def _can_start(self, lane: str) -> bool:
+        running = self.lanes[SMALL].running + self.lanes[LARGE].running
+        if running >= self.slots:
+            return False
+        large_can_start = self.lanes[LARGE].running < self.slots - self.small_reserved
+        if lane == LARGE:
+            return large_can_start
+        if large_can_start and self.lanes[LARGE].waiting and self.small_max_streak:
+            if self.small_streak >= self.small_max_streak:
+                # hold the shared slots for the waiting large sample
+                return self.lanes[SMALL].running < self.small_reserved
+        return True
+
+    @contextlib.contextmanager
+    def slot(self, type_key: str, size: int) -> Iterator[str]:
+        """Wait for capacity in the sample's lane, yielding the lane while the enclosed run holds it."""
+        lane = self.classify(type_key, size)
+        stats = self.lanes[lane]
+        queued = time.monotonic()
+        with self._cond:
+            stats.waiting += 1
+            if self.enabled:
+                self._cond.wait_for(lambda: self._can_start(lane))
+            stats.waiting -= 1
+            stats.running += 1
+            if lane == LARGE:
+                self.small_streak = 0
+            elif self.lanes[LARGE].waiting:
+                self.small_streak += 1
+            waited = time.monotonic() - queued
+            stats.wait_seconds += waited
+            stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+        start = time.monotonic()
+        try:
+            yield lane
+        finally:
+            seconds = time.monotonic() - start
+            with self._cond:
+                stats.running -= 1
+                stats.jobs += 1
+                stats.run_seconds += seconds
+                key = (type_key, size_bucket(size))
+                previous = self.costs.get(key)
+                self.costs[key] = seconds if previous is None else previous + EWMA_ALPHA * (seconds - previous)
+                self._cond.notify_all()
+
+    def report(self) -> dict:
+        """Summarise queue wait and throughput per lane."""
+        with self._cond:
+            elapsed = time.monotonic() - self.started
+            return {lane: stats.report(elapsed) for lane, stats in self.lanes.items()}
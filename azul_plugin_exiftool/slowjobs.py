@@ -0,0 +1,134 @@
+"""Capture diagnostics for jobs that exceed a time threshold so pathological files can be triaged offline."""
+
+import contextlib
+import cProfile
+import datetime
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Iterator
+
+from azul_plugin_exiftool.util import file_sha256
+
+logger = logging.getLogger(__name__)
+
+
+class ScanTrace:
+    """Details of a single scan, filled in as it progresses."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.timings: dict[str, float] = {}
+        self.exiftool_args: list[str] = []
+        self.exiftool_returncode: int | None = None
+        self.exiftool_stderr = b""
+        # peak resident memory of the exiftool run, when the launcher reports it
+        self.exiftool_maxrss_kb: int | None = None
+        self.file_type = ""
+        self._sha256 = None
+
+    @property
+    def sha256(self) -> str:
+        """The sha256 of the file being scanned, hashed on first use."""
+        if self._sha256 is None:
+            self._sha256 = file_sha256(self.path)
+        return self._sha256
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Accumulate the wall time spent in the named phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class SlowJobRecorder:
+    """Write a report for each scan that takes longer than threshold seconds.
+
+    Reports go into their own sub directory of `directory`, only the newest `max_reports` are kept.
+    A threshold of 0 disables capture entirely.
+    """
+
+    def __init__(self, threshold: float, directory: str = "", max_reports: int = 50, profile: bool = False):
+        self.threshold = threshold
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "azul-exiftool-slow-jobs")
+        self.max_reports = max_reports
+        self.profile = profile
+
+    @property
+    def enabled(self) -> bool:
+        """Whether slow jobs are being captured."""
+        return self.threshold > 0
+
+    @contextlib.contextmanager
+    def watch(self, trace: ScanTrace) -> Iterator[None]:
+        """Time the enclosed scan and write a report if it is slow, including when it raises."""
+        if not self.enabled:
+            yield
+            return
+        profiler = None
+        if self.profile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # only one profiler may be active at a time, skip profiling concurrent scans
+                profiler = None
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold:
+                try:
+                    self.record(trace, elapsed, profiler, error)
+                except OSError as e:
+                    logger.warning(f"failed to write slow job report for {trace.path}: {e}")
+
+    def record(
+        self, trace: ScanTrace, elapsed: float, profiler: cProfile.Profile | None, error: BaseException | None
+    ) -> str:
+        """Write the report for a slow scan, returning the directory it was written to."""
+        sha256 = trace.sha256 if os.path.exists(trace.path) else ""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        report_dir = os.path.join(self.directory, f"{now.strftime('%Y%m%dT%H%M%S.%f')}-{sha256[:16] or 'missing'}")
+        os.makedirs(report_dir, exist_ok=True)
+        report = {
+            "sha256": sha256,
+            "path": trace.path,
+            "size": os.path.getsize(trace.path) if os.path.exists(trace.path) else -1,
+            "file_type": trace.file_type,
+            "seconds": round(elapsed, 6),
+            "threshold": self.threshold,
+            "captured_at": now.isoformat(),
+            "exiftool_args": trace.exiftool_args,
+            "exiftool_returncode": trace.exiftool_returncode,
+            "exiftool_stderr": trace.exiftool_stderr.decode("utf-8", errors="replace"),
+            "exiftool_maxrss_kb": trace.exiftool_maxrss_kb,
+            "timings": {k: round(v, 6) for k, v in trace.timings.items()},
+            "error": f"{type(error).__name__}: {error}" if error else None,
+        }
+        with open(os.path.join(report_dir, "report.json"), "w") as f:
+            json.dump(report, f, indent=2)
+        if profiler:
+            profiler.dump_stats(os.path.join(report_dir, "profile.pstats"))
+        logger.warning(f"slow job took {elapsed:.1f}s, report written to {report_dir}")
+        self.rotate()
+        return report_dir
+
+    def rotate(self):
+        """Remove the oldest reports beyond max_reports."""
+        reports = sorted(e for e in os.listdir(self.directory) if os.path.isdir(os.path.join(self.directory, e)))
+        for old in reports[: max(len(reports) - self.max_reports, 0)]:
+            shutil.rmtree(os.path.join(self.directory, old), ignore_errors=True)
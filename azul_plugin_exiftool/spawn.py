@@ -0,0 +1,132 @@
+"""Start exiftool with less per-run overhead than subprocess.run.
+
+The environment and executable path are worked out once rather than per run, and the child is started with
+os.posix_spawn, which glibc implements with vfork semantics so the parent's memory is never copied. Python creates
+descriptors non-inheritable, so of those only the pipes duplicated onto stdin, stdout and stderr reach the child.
+Descriptors opened outside Python without close-on-exec (eg. by an extension module, or inherited from whatever
+started this process) are found in /proc/self/fd and closed in the child, rather than running subprocess's
+close_fds loop over every possible descriptor.
+"""
+
+import errno
+import os
+import resource
+import selectors
+import shutil
+import signal
+import subprocess  # nosec B404
+import time
+
+
+def exiftool_env() -> dict[str, str]:
+    """Return the environment exiftool runs with."""
+    # I believe we want to force UTC as some date times are reported in local tz
+    # however, we want to ensure this doesn't override tz in fields that store their
+    # own tz info, so not sure if there's a way to force preserve that.
+    env = dict(os.environ)
+    env["TZ"] = "UTC"
+    return env
+
+
+def inherited_fds() -> list[int]:
+    """Return the descriptors above stderr that a spawned child would inherit."""
+    try:
+        fds = [int(fd) for fd in os.listdir("/proc/self/fd")]
+    except FileNotFoundError:
+        # without procfs only the descriptors Python created, which are never inheritable, are known to be kept out
+        return []
+    inherited = []
+    for fd in fds:
+        if fd <= 2:
+            continue
+        try:
+            if os.get_inheritable(fd):
+                inherited.append(fd)
+        except OSError:
+            # the handle listdir read the directory through, closed since
+            continue
+    return inherited
+
+
+class Launcher:
+    """Run commands with a fixed environment via posix_spawn, capturing output like subprocess.run."""
+
+    def __init__(self, env: dict[str, str] | None = None):
+        self.env = env if env is not None else exiftool_env()
+        self._executables: dict[str, str] = {}
+
+    def executable(self, name: str) -> str:
+        """Resolve a command name against PATH, once per name."""
+        path = self._executables.get(name)
+        if path is None:
+            path = name if os.sep in name else shutil.which(name, path=self.env.get("PATH"))
+            if path is None:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), name)
+            self._executables[name] = path
+        return path
+
+    def run(
+        self, args: list[str], timeout: float | None = None
+    ) -> tuple[subprocess.CompletedProcess, resource.struct_rusage]:
+        """Run args to completion, returning the finished process and the child's resource usage.
+
+        Raises TimeoutExpired, after killing the child, if it runs longer than timeout seconds.
+        """
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        try:
+            pid = os.posix_spawn(
+                self.executable(args[0]),
+                args,
+                self.env,
+                file_actions=[
+                    (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+                    (os.POSIX_SPAWN_DUP2, out_w, 1),
+                    (os.POSIX_SPAWN_DUP2, err_w, 2),
+                    *((os.POSIX_SPAWN_CLOSE, fd) for fd in inherited_fds()),
+                ],
+            )
+        except BaseException:
+            os.close(out_r)
+            os.close(err_r)
+            raise
+        finally:
+            os.close(out_w)
+            os.close(err_w)
+
+        try:
+            stdout, stderr, timed_out = self._communicate(out_r, err_r, timeout)
+        except BaseException:
+            # don't leave the child running or unreaped
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            raise
+        finally:
+            os.close(out_r)
+            os.close(err_r)
+        if timed_out and timeout is not None:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            raise subprocess.TimeoutExpired(args, timeout, output=stdout, stderr=stderr)
+        _, status, usage = os.wait4(pid, 0)
+        return subprocess.CompletedProcess(args, os.waitstatus_to_exitcode(status), stdout, stderr), usage
+
+    @staticmethod
+    def _communicate(out_r: int, err_r: int, timeout: float | None) -> tuple[bytes, bytes, bool]:
+        """Read both pipes until the child closes them or the timeout passes."""
+        chunks: dict[int, list[bytes]] = {out_r: [], err_r: []}
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with selectors.DefaultSelector() as selector:
+            for fd in chunks:
+                selector.register(fd, selectors.EVENT_READ)
+            while selector.get_map():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return b"".join(chunks[out_r]), b"".join(chunks[err_r]), True
+                for key, _ in selector.select(remaining):
+                    data = os.read(key.fd, 65536)
+                    if data:
+                        chunks[key.fd].append(data)
+                    else:
+                        selector.unregister(key.fd)
+        return b"".join(chunks[out_r]), b"".join(chunks[err_r]), False
@@ -0,0 +1,184 @@
+"""Running statistics of the tags exiftool reports, to guide which tags to map, ignore or stop extracting."""
+
+import json
+import logging
+import multiprocessing.util
+import threading
+import time
+
+from azul_plugin_exiftool.util import file_lock, replace_file
+
+logger = logging.getLogger(__name__)
+
+
+class TagCounter:
+    """Totals for a single tag within a file type."""
+
+    __slots__ = ("count", "total_length", "truncated")
+
+    def __init__(self):
+        self.count = 0
+        self.total_length = 0
+        self.truncated = 0
+
+
+class FileTypeStats:
+    """Totals for every tag seen in samples of one file type."""
+
+    def __init__(self):
+        self.jobs = 0
+        self.exiftool_jobs = 0
+        self.exiftool_seconds = 0.0
+        self.tags: dict[str, TagCounter] = {}
+
+    def merge(self, other: "FileTypeStats"):
+        """Add another set of totals for the same file type to these."""
+        self.jobs += other.jobs
+        self.exiftool_jobs += other.exiftool_jobs
+        self.exiftool_seconds += other.exiftool_seconds
+        for tag, c in other.tags.items():
+            counter = self.tags.get(tag)
+            if counter is None:
+                counter = self.tags[tag] = TagCounter()
+            counter.count += c.count
+            counter.total_length += c.total_length
+            counter.truncated += c.truncated
+
+
+def summarise(file_types: dict[str, FileTypeStats]) -> dict:
+    """Summarise statistics as a report, file types by job count and tags by frequency.
+
+    The raw totals are kept beside the derived rates so reports can be merged.
+    """
+    out = {}
+    for file_type, stats in sorted(file_types.items(), key=lambda x: -x[1].jobs):
+        tags = {}
+        for tag, c in sorted(stats.tags.items(), key=lambda x: (-x[1].count, x[0])):
+            tags[tag] = {
+                "count": c.count,
+                "frequency": round(c.count / stats.jobs, 4) if stats.jobs else 0.0,
+                "mean_length": round(c.total_length / c.count, 1),
+                "truncation_rate": round(c.truncated / c.count, 4),
+                "total_length": c.total_length,
+                "truncated": c.truncated,
+            }
+        out[file_type] = {
+            "jobs": stats.jobs,
+            "exiftool_jobs": stats.exiftool_jobs,
+            "mean_exiftool_seconds": (
+                round(stats.exiftool_seconds / stats.exiftool_jobs, 6) if stats.exiftool_jobs else None
+            ),
+            "total_exiftool_seconds": stats.exiftool_seconds,
+            "tags": tags,
+        }
+    return {"generated": time.time(), "file_types": out}
+
+
+def load_report(path: str) -> dict[str, FileTypeStats]:
+    """Read the totals back out of a report written by `summarise`, empty if there isn't a readable one."""
+    try:
+        with open(path) as f:
+            report = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        logger.warning(f"replacing unreadable tag statistics at {path}: {e}")
+        return {}
+    file_types = {}
+    try:
+        for file_type, summary in report["file_types"].items():
+            stats = file_types[file_type] = FileTypeStats()
+            stats.jobs = summary["jobs"]
+            stats.exiftool_jobs = summary["exiftool_jobs"]
+            stats.exiftool_seconds = summary["total_exiftool_seconds"]
+            for tag, t in summary["tags"].items():
+                counter = stats.tags[tag] = TagCounter()
+                counter.count = t["count"]
+                counter.total_length = t["total_length"]
+                counter.truncated = t["truncated"]
+    except (KeyError, TypeError, AttributeError) as e:
+        logger.warning(f"replacing tag statistics at {path} without the totals to add to: {e}")
+        return {}
+    return file_types
+
+
+class TagStatistics:
+    """Per exiftool FileType tag frequency, mean value length, truncation rate and exiftool cost.
+
+    When `path` is set, the counts since the last write are added to the report there every `interval` jobs and
+    when a cleanly exiting process (including multiprocessing workers) shuts down, so every process or instance
+    sharing `path` contributes to one report.
+    """
+
+    def __init__(self, path: str = "", interval: int = 1000):
+        self.path = path
+        self.interval = max(interval, 1)
+        # totals of this instance, and the part of them not yet added to the report at `path`
+        self.file_types: dict[str, FileTypeStats] = {}
+        self._unwritten: dict[str, FileTypeStats] = {}
+        self._since_write = 0
+        self._lock = threading.Lock()
+        if path:
+            # unlike atexit, also run when a multiprocessing worker process exits
+            multiprocessing.util.Finalize(self, self.flush, exitpriority=0)
+
+    def _stats(self, file_type: str) -> tuple[FileTypeStats, FileTypeStats]:
+        file_type = file_type or "unknown"
+        return (
+            self.file_types.setdefault(file_type, FileTypeStats()),
+            self._unwritten.setdefault(file_type, FileTypeStats()),
+        )
+
+    def observe(self, file_type: str, fields: list[tuple[str, int, bool]]):
+        """Record the (tag, value length, truncated) of every field reported for one sample."""
+        with self._lock:
+            for stats in self._stats(file_type):
+                stats.jobs += 1
+                for tag, length, truncated in fields:
+                    counter = stats.tags.get(tag)
+                    if counter is None:
+                        counter = stats.tags[tag] = TagCounter()
+                    counter.count += 1
+                    counter.total_length += length
+                    counter.truncated += truncated
+
+    def observe_cost(self, file_type: str, seconds: float):
+        """Record how long exiftool took over one sample, writing the report if it is due."""
+        with self._lock:
+            for stats in self._stats(file_type):
+                stats.exiftool_jobs += 1
+                stats.exiftool_seconds += seconds
+            self._since_write += 1
+            due = self.path and self._since_write >= self.interval
+            if due:
+                self._since_write = 0
+        if due:
+            self.write()
+
+    def report(self) -> dict:
+        """Summarise the statistics of this instance, file types by job count and tags by frequency."""
+        with self._lock:
+            return summarise(self.file_types)
+
+    def write(self, path: str | None = None):
+        """Add the counts since the last write to the report at `path`, replacing it atomically.
+
+        Failures are logged rather than raised, so writing statistics never fails a scan.
+        """
+        path = path or self.path
+        with self._lock:
+            try:
+                with file_lock(path):
+                    totals = load_report(path)
+                    for file_type, stats in self._unwritten.items():
+                        totals.setdefault(file_type, FileTypeStats()).merge(stats)
+                    replace_file(path, json.dumps(summarise(totals), indent=2).encode("utf-8"))
+            except OSError as e:
+                logger.warning(f"failed to write tag statistics to {path}: {e}")
+                return
+            self._unwritten = {}
+
+    def flush(self):
+        """Write the report to `path` if anything was observed since it was last written."""
+        if self.path and self._unwritten:
+            self.write()
@@ -0,0 +1,133 @@
+"""Warm exiftool before the plugin takes work, so the first jobs don't pay its cold start.
+
+Running exiftool once over a tiny corpus of common file types pulls perl, ExifTool and the format modules those
+types need into the page cache.
+"""
+
+import io
+import json
+import os
+import struct
+import subprocess  # nosec B404
+import tempfile
+import time
+import zipfile
+import zlib
+
+
+def _png() -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(b"\x00\x00\x00\x00"))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _gif() -> bytes:
+    return (
+        b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff"
+        + b"\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02\x44\x01\x00\x3b"
+    )
+
+
+def _jpeg() -> bytes:
+    app0 = b"JFIF\x00\x01\x01\x01\x00\x60\x00\x60\x00\x00"
+    sof0 = b"\x08\x00\x01\x00\x01\x01\x01\x11\x00"
+    return (
+        b"\xff\xd8"
+        + b"\xff\xe0"
+        + struct.pack(">H", len(app0) + 2)
+        + app0
+        + b"\xff\xc0"
+        + struct.pack(">H", len(sof0) + 2)
+        + sof0
+        + b"\xff\xd9"
+    )
+
+
+def _tiff() -> bytes:
+    # little endian header, a single IFD with ImageWidth and ImageLength
+    entries = struct.pack("<HHII", 256, 4, 1, 1) + struct.pack("<HHII", 257, 4, 1, 1)
+    return b"II*\x00" + struct.pack("<I", 8) + struct.pack("<H", 2) + entries + struct.pack("<I", 0)
+
+
+def _pe() -> bytes:
+    dos = bytearray(0x40)
+    dos[0:2] = b"MZ"
+    struct.pack_into("<I", dos, 0x3C, 0x40)
+    # COFF header for an i386 executable with a 32 bit optional header
+    coff = struct.pack("<HHIIIHH", 0x14C, 0, 0, 0, 0, 0xE0, 0x0102)
+    optional = bytearray(0xE0)
+    struct.pack_into("<H", optional, 0, 0x10B)
+    return bytes(dos) + b"PE\x00\x00" + coff + bytes(optional)
+
+
+def _pdf() -> bytes:
+    return (
+        b"%PDF-1.4\n1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n"
+        b"2 0 obj\n<< /Type /Pages /Kids [] /Count 0 >>\nendobj\n"
+        b"trailer\n<< /Root 1 0 R >>\n%%EOF\n"
+    )
+
+
+def _zip() -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("warmup.txt", "warm")
+    return buf.getvalue()
+
+
+def _mp4() -> bytes:
+    return struct.pack(">I", 20) + b"ftypisom" + struct.pack(">I", 512) + b"isom"
+
+
+# representative samples written out for the warm up run
+CORPUS = {
+    "sample.png": _png,
+    "sample.gif": _gif,
+    "sample.jpg": _jpeg,
+    "sample.tif": _tiff,
+    "sample.exe": _pe,
+    "sample.pdf": _pdf,
+    "sample.zip": _zip,
+    "sample.mp4": _mp4,
+    "sample.json": lambda: json.dumps({"warm": "up"}).encode(),
+    "sample.xml": lambda: b'<?xml version="1.0"?><root><warm>up</warm></root>',
+}
+
+
+def warm_exiftool(command: list[str], timeout: float = 60) -> dict:
+    """Run exiftool over the built-in corpus, returning how long it took.
+
+    command is the exiftool command line excluding the files to scan, eg. ['exiftool', '-json'].
+    The corpus is scanned in one run to load every module, then once more per file to measure warm latency.
+    """
+    env = dict(os.environ)
+    env["TZ"] = "UTC"
+    with tempfile.TemporaryDirectory(prefix="azul-exiftool-warmup-") as tmp:
+        paths = []
+        for name, build in CORPUS.items():
+            path = os.path.join(tmp, name)
+            with open(path, "wb") as f:
+                f.write(build())
+            paths.append(path)
+
+        start = time.perf_counter()
+        subprocess.run(command + paths, env=env, capture_output=True, timeout=timeout)  # noqa: S603
+        cold = time.perf_counter() - start
+
+        warm = []
+        for path in paths:
+            start = time.perf_counter()
+            subprocess.run(command + [path], env=env, capture_output=True, timeout=timeout)  # noqa: S603
+            warm.append(time.perf_counter() - start)
+    return {
+        "files": len(paths),
+        "cold_seconds": round(cold, 6),
+        "warm_mean_seconds": round(sum(warm) / len(warm), 6),
+        "warm_max_seconds": round(max(warm), 6),
+    }
@@ -0,0 +1,63 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from azul_plugin_exiftool.archive import RawArchive, export_archive, import_archive
+
+SHA256 = "ab" + "0" * 62
+
+
+class TestRawArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.archive = RawArchive(self.tmp.name, "13.25")
+
+    def test_put_get(self):
+        self.assertIsNone(self.archive.get(SHA256))
+        self.assertNotIn(SHA256, self.archive)
+        self.assertTrue(self.archive.put(SHA256, b'[{"FileType": "JSON"}]'))
+        self.assertIn(SHA256, self.archive)
+        self.assertEqual(self.archive.get(SHA256), b'[{"FileType": "JSON"}]')
+        path = os.path.join(self.tmp.name, "13.25", "ab", f"{SHA256}.json.gz")
+        with gzip.open(path) as f:
+            self.assertEqual(f.read(), b'[{"FileType": "JSON"}]')
+        # content addressed, so existing output is kept unless overwriting
+        self.assertFalse(self.archive.put(SHA256, b"[]"))
+        self.assertEqual(self.archive.get(SHA256), b'[{"FileType": "JSON"}]')
+        self.assertTrue(self.archive.put(SHA256, b"[]", overwrite=True))
+        self.assertEqual(self.archive.get(SHA256), b"[]")
+
+    def test_iter_paths(self):
+        self.archive.put(SHA256, b"[]")
+        RawArchive(self.tmp.name, "12.76").put(SHA256, b"[]")
+        self.assertEqual(self.archive.versions(), ["12.76", "13.25"])
+        self.assertEqual([(s, v) for s, v, _ in self.archive.iter_paths()], [(SHA256, "12.76"), (SHA256, "13.25")])
+        self.assertEqual([v for _, v, _ in self.archive.iter_paths("13.25")], ["13.25"])
+        self.assertEqual(list(RawArchive(os.path.join(self.tmp.name, "missing"), "1").iter_paths()), [])
+
+    def test_export_import(self):
+        self.archive.put(SHA256, b'[{"Title": "caf\xc3\xa9 \xff"}]')
+        RawArchive(self.tmp.name, "12.76").put("cd" + "0" * 62, b"[]")
+        exported = os.path.join(self.tmp.name, "export.jsonl.gz")
+        self.assertEqual(export_archive(self.archive, exported), {"exported": 2, "versions": {"12.76": 1, "13.25": 1}})
+
+        target = RawArchive(os.path.join(self.tmp.name, "new"), "13.25")
+        self.assertEqual(
+            import_archive(target, exported, batch_size=1),
+            {"imported": 1, "already_present": 0, "version_mismatch": 1},
+        )
+        self.assertEqual(target.get(SHA256), b'[{"Title": "caf\xc3\xa9 \xff"}]')
+        self.assertEqual(
+            import_archive(target, exported, allow_version_mismatch=True),
+            {"imported": 1, "already_present": 1, "version_mismatch": 0},
+        )
+        self.assertEqual(target.versions(), ["12.76", "13.25"])
+
+    def test_import_rejects_other_files(self):
+        bad = os.path.join(self.tmp.name, "bad.gz")
+        with gzip.open(bad, "wt") as f:
+            f.write('{"something": "else"}\n')
+        with self.assertRaises(ValueError):
+            import_archive(self.archive, bad)
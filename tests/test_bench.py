@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+import unittest
+
+from azul_runner import FV
+
+from azul_plugin_exiftool import bench
+from azul_plugin_exiftool.main import EXIFTOOL_CONFIG, exiftool_command
+
+
+class TestBench(unittest.TestCase):
+    def test_exiftool_command(self):
+        self.assertEqual(exiftool_command("a.bin"), ["exiftool", "-json", "a.bin"])
+        # -config must be the first argument
+        self.assertEqual(
+            exiftool_command("a.bin", EXIFTOOL_CONFIG, composite=False),
+            ["exiftool", "-config", EXIFTOOL_CONFIG, "-e", "-json", "a.bin"],
+        )
+        self.assertTrue(os.path.exists(EXIFTOOL_CONFIG))
+
+    def test_startup(self):
+        result = bench.measure_startup(runs=2)
+        self.assertEqual(
+            set(result), {"version_only", "default_config", "plugin_config", "plugin_config_no_composite"}
+        )
+        for summary in result.values():
+            self.assertEqual(summary["runs"], 2)
+            self.assertLessEqual(summary["min"], summary["max"])
+
+    def test_spawn(self):
+        result = bench.measure_spawn(runs=2)
+        self.assertGreater(result["fd_limit"], 0)
+        for name in ("true", "exiftool_version"):
+            self.assertEqual(result[name]["subprocess_run"]["runs"], 2)
+            self.assertEqual(result[name]["posix_spawn"]["runs"], 2)
+
+    def test_feature_diff(self):
+        diff = bench.feature_diff(
+            {"mime": "image/png", "exif_metadata": [FV("1", label="ImageWidth"), FV("PNG", label="FileType")]},
+            {"mime": "image/png", "exif_metadata": [FV("2", label="ImageWidth"), FV("PNG", label="FileType")]},
+        )
+        self.assertEqual(
+            diff,
+            {
+                "removed": {"exif_metadata": [{"value": "1", "label": "ImageWidth"}]},
+                "added": {"exif_metadata": [{"value": "2", "label": "ImageWidth"}]},
+            },
+        )
+
+    def test_compare_same_exiftool(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "sample.json"), "w") as f:
+                json.dump({"compare": "me"}, f)
+            result = bench.compare_exiftools([tmp], "exiftool", "exiftool")
+        self.assertEqual(result["baseline"]["version"], result["candidate"]["version"])
+        self.assertEqual(result["file_types"]["JSON"]["files"], 1)
+        self.assertEqual(result["file_types"]["JSON"]["files_changed"], 0)
+        self.assertGreater(result["file_types"]["JSON"]["candidate_peak_rss_kb"], 0)
+        self.assertEqual(result["diffs"], [])
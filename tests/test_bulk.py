@@ -0,0 +1,139 @@
+import io
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from azul_runner import State, test_template
+
+from azul_plugin_exiftool import bulk
+from azul_plugin_exiftool.archive import RawArchive
+from azul_plugin_exiftool.main import AzulPluginExifTool
+from azul_plugin_exiftool.pipeline import ScanPipeline
+
+
+class TestBulk(test_template.TestPlugin):
+    PLUGIN_TO_TEST = AzulPluginExifTool
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.corpus = os.path.join(self.tmp.name, "corpus")
+        os.makedirs(os.path.join(self.corpus, "nested"))
+        with open(os.path.join(self.corpus, "a.json"), "w") as f:
+            json.dump({"Title": "bulk test"}, f)
+        with open(os.path.join(self.corpus, "nested", "unknown.bin"), "wb") as f:
+            f.write(b"\x41\x01\x03\x9f\x83")
+        with open(os.path.join(self.corpus, "nested", "zeros.bin"), "wb") as f:
+            f.write(b"\x00" * 64)
+        self.output = os.path.join(self.tmp.name, "out.jsonl")
+
+    def read_output(self):
+        with open(self.output) as f:
+            return {os.path.basename(r["path"]): r for r in map(json.loads, f)}
+
+    def test_scan_directory(self):
+        """Test every file under a directory gets a jsonl record with its features and state."""
+        bulk.main([self.corpus, "-o", self.output, "--workers", "2"])
+        records = self.read_output()
+        self.assertEqual(set(records), {"a.json", "unknown.bin", "zeros.bin"})
+        self.assertEqual(records["a.json"]["state"], {"label": State.Label.COMPLETED.value})
+        self.assertIn({"value": "application/json"}, records["a.json"]["features"]["mime"])
+        self.assertIn({"value": "bulk test", "label": "Title"}, records["a.json"]["features"]["exif_metadata"])
+        self.assertEqual(records["unknown.bin"]["state"]["label"], State.Label.OPT_OUT.value)
+        self.assertEqual(records["zeros.bin"]["state"]["label"], State.Label.COMPLETED_WITH_ERRORS.value)
+        self.assertEqual(records["zeros.bin"]["malformed"], "Binary is full of zeros.")
+
+    def test_resume_skips_recorded_paths(self):
+        """Test a resumed run skips paths already recorded, ignoring a truncated final line."""
+        done = os.path.join(self.corpus, "a.json")
+        with open(self.output, "w") as f:
+            # includes a truncated trailing line as left by an interrupted run
+            f.write(json.dumps({"path": done, "size": 0}) + "\n" + '{"path": "trunc')
+        self.assertEqual(bulk.load_checkpoint(self.output), {done})
+
+        bulk.main([self.corpus, "-o", self.output, "--resume"])
+        with open(self.output) as f:
+            lines = f.read().splitlines()
+        paths = [json.loads(line)["path"] for line in lines[2:]]
+        self.assertEqual(sorted(os.path.basename(p) for p in paths), ["unknown.bin", "zeros.bin"])
+
+    def test_summary(self):
+        """Test the throughput summary counts every file scanned."""
+        out = io.StringIO()
+        paths = bulk.iter_paths([self.corpus])
+        summary = bulk.bulk_scan(AzulPluginExifTool(config={}), paths, out, workers=2)
+        self.assertEqual(summary["files"], 3)
+        self.assertEqual(sum(summary["states"].values()), 3)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+    def test_rederive_from_archive(self):
+        """Test features are re-derived from archived exiftool output with new settings."""
+        archive_dir = os.path.join(self.tmp.name, "archive")
+        bulk.main([self.corpus, "-o", self.output, "-c", f"raw_archive_dir={archive_dir}"])
+        # only the successful exiftool run is archived
+        (entry,) = RawArchive(archive_dir, "").iter_paths()
+
+        rederived = os.path.join(self.tmp.name, "rederived.jsonl")
+        bulk.main(["--rederive", archive_dir, "-o", rederived, "--workers", "1", "-c", "compact_output=true"])
+        with open(rederived) as f:
+            (record,) = map(json.loads, f)
+        self.assertEqual(record["sha256"], entry[0])
+        self.assertEqual(record["exiftool_version"], entry[1])
+        self.assertEqual(record["state"], {"label": State.Label.COMPLETED.value})
+        self.assertIn({"value": "bulk test", "label": "Title"}, record["features"]["exif_metadata"])
+        # re-derived with the new setting, mapped fields are no longer repeated in exif_metadata
+        self.assertNotIn("MIMEType", [v["label"] for v in record["features"]["exif_metadata"]])
+
+    def test_inflight_degrades(self):
+        """Test files scanned while another is in flight use the degraded mode and are annotated with it."""
+        for name in ("first.json", "second.json"):
+            with open(os.path.join(self.tmp.name, name), "w") as f:
+                json.dump({"Title": name}, f)
+        plugin = AzulPluginExifTool(config={"degrade_inflight_thresholds": "2"})
+        run_exiftool = plugin.run_exiftool
+        # both jobs start before either finishes
+        barrier = threading.Barrier(2)
+
+        def overlapping(*args, **kwargs):
+            barrier.wait(timeout=30)
+            return run_exiftool(*args, **kwargs)
+
+        out = io.StringIO()
+        paths = [os.path.join(self.tmp.name, name) for name in ("first.json", "second.json")]
+        with mock.patch.object(plugin, "run_exiftool", side_effect=overlapping):
+            bulk.bulk_scan(plugin, paths, out, workers=2)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(sorted(r["mode"] for r in records), ["fast", "full"])
+        (degraded,) = [r for r in records if r["mode"] == "fast"]
+        self.assertEqual(degraded["features"]["exif_extraction_mode"], [{"value": "fast"}])
+
+    def test_pipeline(self):
+        """Test the staged pipeline scans the corpus and reports per-stage counts."""
+        out = io.StringIO()
+        plugin = AzulPluginExifTool(config={})
+        pipeline = ScanPipeline(plugin, precheck_workers=2, exiftool_workers=2, post_workers=1)
+        summary = bulk.bulk_scan(plugin, bulk.iter_paths([self.corpus]), out, 2, None, pipeline)
+        self.assertEqual(summary["files"], 3)
+        self.assertEqual(set(summary["stages"]), {"precheck", "exiftool", "post"})
+        self.assertEqual(summary["stages"]["precheck"]["items"], 3)
+        # the all zero file is settled by the precheck so never reaches exiftool
+        self.assertEqual(summary["stages"]["exiftool"]["items"], 2)
+        records = {os.path.basename(r["path"]): r for r in map(json.loads, out.getvalue().splitlines())}
+        self.assertEqual(records["zeros.bin"]["malformed"], "Binary is full of zeros.")
+        self.assertIn({"value": "application/json"}, records["a.json"]["features"]["mime"])
+
+    def test_pipeline_feed_error(self):
+        """Test an error listing the paths to scan is raised rather than cutting the run short."""
+
+        def paths():
+            yield os.path.join(self.corpus, "a.json")
+            raise OSError("listing failed")
+
+        pipeline = ScanPipeline(AzulPluginExifTool(config={}), 1, 1, 1)
+        results = []
+        with self.assertRaisesRegex(OSError, "listing failed"):
+            pipeline.run(paths(), lambda item, seconds: results.append(item))
+        self.assertEqual(len(results), 1)
@@ -1,19 +1,32 @@
+import os
+import subprocess
+import tempfile
+from typing import Any
+from unittest import mock
+
 from azul_runner import (
     FV,
     Event,
     EventData,
     EventParent,
+    FeatureValue,
     JobResult,
     State,
     test_template,
 )
 
-from azul_plugin_exiftool.main import IGNORED_FIELDS_WHEN_TOO_LONG, AzulPluginExifTool
+from azul_plugin_exiftool.loadcontrol import DegradationController
+from azul_plugin_exiftool.main import IGNORED_FIELDS_WHEN_TOO_LONG, AzulPluginExifTool, feature_values
+from azul_plugin_exiftool.warmup import CORPUS
 
 
 class TestExifTool(test_template.TestPlugin):
     PLUGIN_TO_TEST = AzulPluginExifTool
 
+    def execute_with(self, data: bytes, config: dict[str, Any]) -> JobResult:
+        """Run the plugin over data with the given settings, typed as the plugin itself accepts them."""
+        return self.do_execution(data_in=[("content", data)], config=config)
+
     def test_unknown(self):
         """
         Test the plugin OPTOUT's of unknown file types rather than erroring.
@@ -911,3 +924,233 @@ class TestExifTool(test_template.TestPlugin):
                 )
             ),
         )
+
+    def test_exif_metadata_budget(self):
+        """Test exif_metadata is trimmed to the configured budget, keeping mapped and priority fields."""
+        result = self.execute_with(
+            b'{"alpha": "one", "beta": "two", "gamma": "three"}',
+            {"max_exif_values": 3, "exif_priority_fields": "FileType"},
+        )
+        self.assertJobResult(
+            result,
+            JobResult(
+                state=State(
+                    State.Label.COMPLETED_WITH_ERRORS,
+                    message="Completed but 3 exif_metadata values were dropped to fit the per-job budget",
+                ),
+                events=[
+                    Event(
+                        sha256="b728b9ac8fa92bed56f0e2040799988b2aab3521e3683bc72ed2d5cb650cca35",
+                        features={
+                            "exif_metadata": [
+                                FV("JSON", label="FileType"),
+                                FV("application/json", label="MIMEType"),
+                                FV("json", label="FileTypeExtension"),
+                            ],
+                            "mime": [FV("application/json")],
+                        },
+                    )
+                ],
+            ),
+        )
+
+    def test_exif_metadata_byte_budget(self):
+        """Test values that don't fit the byte budget are dropped while smaller ones are still kept."""
+        plugin = AzulPluginExifTool(config={"max_exif_bytes": 40})
+        features: dict[str, list[FeatureValue] | int | str] = {
+            "exif_metadata": [
+                FV("x" * 40, label="Big"),
+                FV("application/json", label="MIMEType"),
+                FV("small", label="Small"),
+            ]
+        }
+        self.assertEqual(plugin.apply_exif_budget(features), 1)
+        self.assertEqual(
+            features["exif_metadata"], [FV("application/json", label="MIMEType"), FV("small", label="Small")]
+        )
+
+    def test_compact_output(self):
+        """Test compact output doesn't repeat mapped fields in exif_metadata."""
+        plugin = AzulPluginExifTool(config={"compact_output": True})
+        features, truncated = plugin.features('[{"MIMEType": "application/json", "Title": "a", "Author": "b"}]')
+        self.assertEqual(truncated, [])
+        self.assertEqual(features["mime"], "application/json")
+        self.assertEqual(features["exif_metadata"], [FV("a", label="Title"), FV("b", label="Author")])
+
+        features, _ = AzulPluginExifTool(config={}).features('[{"MIMEType": "application/json", "Title": "a"}]')
+        self.assertEqual(features["exif_metadata"], [FV("application/json", label="MIMEType"), FV("a", label="Title")])
+
+    def test_degraded_extraction_mode_annotated(self):
+        """Test jobs extracted with a cheaper mode under load are annotated with the mode used."""
+        with mock.patch.object(DegradationController, "begin", return_value="fast"):
+            result = self.do_execution(data_in=[("content", b'{"alpha": "one", "beta": "two", "gamma": "three"}')])
+        self.assertJobResult(
+            result,
+            JobResult(
+                state=State(State.Label.COMPLETED),
+                events=[
+                    Event(
+                        sha256="b728b9ac8fa92bed56f0e2040799988b2aab3521e3683bc72ed2d5cb650cca35",
+                        features={
+                            "exif_extraction_mode": [FV("fast")],
+                            "exif_metadata": [
+                                FV("JSON", label="FileType"),
+                                FV("application/json", label="MIMEType"),
+                                FV("json", label="FileTypeExtension"),
+                                FV("one", label="Alpha"),
+                                FV("three", label="Gamma"),
+                                FV("two", label="Beta"),
+                            ],
+                            "mime": [FV("application/json")],
+                        },
+                    )
+                ],
+            ),
+        )
+
+    def test_mapped_pass_survives_full_timeout(self):
+        """Test the mapped fields are still published when the full exiftool pass times out."""
+        run = subprocess.run
+
+        def full_pass_times_out(args, **kwargs):
+            if "-MIMEType" not in args:
+                raise subprocess.TimeoutExpired(args, kwargs["timeout"])
+            return run(args, **kwargs)
+
+        with mock.patch("subprocess.run", side_effect=full_pass_times_out):
+            result = self.execute_with(
+                b'{"alpha": "one", "beta": "two", "gamma": "three"}',
+                {"mapped_pass_timeout": 10, "mapped_pass_min_size": 0},
+            )
+        self.assertJobResult(
+            result,
+            JobResult(
+                state=State(
+                    State.Label.COMPLETED_WITH_ERRORS,
+                    message="Completed but only the mapped fields were extracted as the full extraction timed out",
+                ),
+                events=[
+                    Event(
+                        sha256="b728b9ac8fa92bed56f0e2040799988b2aab3521e3683bc72ed2d5cb650cca35",
+                        features={
+                            "exif_extraction_mode": [FV("mapped")],
+                            "exif_metadata": [
+                                FV("JSON", label="FileType"),
+                                FV("application/json", label="MIMEType"),
+                            ],
+                            "mime": [FV("application/json")],
+                        },
+                    )
+                ],
+            ),
+        )
+
+    def test_record_and_replay(self):
+        """Test a recorded exiftool run replays to the same result without exiftool."""
+        data = b'{"alpha": "one", "beta": "two", "gamma": "three"}'
+        with tempfile.TemporaryDirectory() as fixtures:
+            recorded = self.execute_with(data, {"exiftool_record_dir": fixtures})
+            self.assertEqual(len(os.listdir(fixtures)), 1)
+            with mock.patch("subprocess.run", side_effect=AssertionError("exiftool should not run")):
+                replayed = self.execute_with(data, {"exiftool_replay_dir": fixtures})
+        self.assertJobResult(replayed, recorded)
+
+    def test_raw_archive_lookup(self):
+        """Test archived exiftool output is reused instead of running exiftool again."""
+        data = b'{"alpha": "one", "beta": "two", "gamma": "three"}'
+        with tempfile.TemporaryDirectory() as archive:
+            first = self.execute_with(data, {"raw_archive_dir": archive})
+            with mock.patch("subprocess.run", side_effect=AssertionError("exiftool should not run")):
+                second = self.execute_with(data, {"raw_archive_dir": archive, "raw_archive_lookup": True})
+        self.assertJobResult(second, first)
+
+    def test_warmup(self):
+        """Test warm up only runs when enabled and reports over the built-in corpus."""
+        plugin = AzulPluginExifTool(config={})
+        self.assertTrue(plugin.is_ready())
+        self.assertIsNone(plugin.warmup_report)
+        plugin = AzulPluginExifTool(config={"warmup": True})
+        # not until the runner is about to fetch a job
+        self.assertIsNone(plugin.warmup_report)
+        self.assertTrue(plugin.is_ready())
+        report = plugin.warmup_report
+        assert report is not None
+        self.assertEqual(report["files"], len(CORPUS))
+        with mock.patch("azul_plugin_exiftool.main.warm_exiftool") as warm:
+            plugin.is_ready()
+        warm.assert_not_called()
+
+    def test_raw_archive_only_default_options(self):
+        """Test output made with other exiftool options is never archived or looked up."""
+        data = b'{"alpha": "one", "beta": "two", "gamma": "three"}'
+        with tempfile.TemporaryDirectory() as archive:
+            plugin = AzulPluginExifTool(config={"raw_archive_dir": archive, "exiftool_composite": False})
+            self.assertIsNone(plugin.archive)
+            self.execute_with(data, {"raw_archive_dir": archive, "embedded_types": "other"})
+            self.assertEqual(os.listdir(archive), [])
+
+    def test_negative_index(self):
+        """Test repeat sightings of an unknown file type are opted out of without running exiftool."""
+        data = b"\x41\x01\x03\x9f\x83"
+        with tempfile.TemporaryDirectory() as tmp:
+            config = {
+                "negative_index": True,
+                "negative_index_path": os.path.join(tmp, "negative.idx"),
+                "negative_index_save_interval": 1,
+                "negative_index_verify_every": 0,
+            }
+            first = self.execute_with(data, config)
+            with mock.patch("subprocess.run", side_effect=AssertionError("exiftool should not run")):
+                second = self.execute_with(data, config)
+        self.assertJobResult(
+            second,
+            JobResult(
+                state=State(
+                    State.Label.OPT_OUT, failure_name="Unknown file type", message="No opt-out reason was provided."
+                )
+            ),
+        )
+
+    def test_embedded_metadata(self):
+        """Test embedded document metadata is published apart from the sample's own and capped per job."""
+        plugin = AzulPluginExifTool(config={"embedded_max_docs": 1})
+        features, _ = plugin.features(
+            '[{"SourceFile": "x.mp4", "Main:FileType": "MP4", "Main:MIMEType": "video/mp4",'
+            ' "Doc1:GPSLatitude": "35.1", "Doc1:MIMEType": "image/jpeg", "Doc2:GPSLatitude": "35.2",'
+            ' "Other:Tag": "x"}]'
+        )
+        self.assertEqual(features["mime"], "video/mp4")
+        # only Main and Doc<n> prefixes name a document, anything else is kept as part of the tag
+        self.assertEqual(
+            [(fv.label, fv.value) for fv in feature_values(features, "exif_metadata")],
+            [("FileType", "MP4"), ("MIMEType", "video/mp4"), ("Other:Tag", "x")],
+        )
+        self.assertEqual(len(feature_values(features, "exif_embedded_metadata")), 3)
+        self.assertEqual(plugin.apply_embedded_budget(features), 1)
+        self.assertEqual(
+            [(fv.label, fv.value) for fv in feature_values(features, "exif_embedded_metadata")],
+            [("Doc1:GPSLatitude", "35.1"), ("Doc1:MIMEType", "image/jpeg")],
+        )
+
+    def test_image_fast_path(self):
+        """Test a simple image read in process publishes the same features as exiftool, annotated as native."""
+        data = CORPUS["sample.png"]()
+        expected = self.do_execution(data_in=[("content", data)])
+        with mock.patch("subprocess.run", side_effect=AssertionError("exiftool should not run")):
+            fast = self.execute_with(data, {"image_fast_path": True})
+        self.assertEqual(fast.events[0].features.pop("exif_extraction_mode"), [FV("native")])
+        self.assertJobResult(fast, expected)
+
+    def test_tag_statistics(self):
+        """Test tag statistics are gathered from the features transform."""
+        with tempfile.TemporaryDirectory() as tmp:
+            plugin = AzulPluginExifTool(
+                config={"tag_stats_path": os.path.join(tmp, "stats.json"), "max_value_length": 10}
+            )
+            plugin.features('[{"FileType": "JSON", "FileName": "x.json", "Title": "a very long title"}]')
+        assert plugin.tag_stats is not None
+        tags = plugin.tag_stats.report()["file_types"]["JSON"]["tags"]
+        # ignored fields are not counted
+        self.assertEqual(set(tags), {"FileType", "Title"})
+        self.assertEqual(tags["Title"]["truncation_rate"], 1.0)
+        self.assertEqual(tags["FileType"]["mean_length"], 4.0)
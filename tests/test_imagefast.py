@@ -0,0 +1,133 @@
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+
+from azul_plugin_exiftool import imagefast
+from azul_plugin_exiftool.warmup import CORPUS
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _exif_jpeg(*tags: tuple[int, int, int, bytes]) -> bytes:
+    """A baseline JPEG whose APP1 holds a little endian IFD0 of (tag, type, count, inline value) entries."""
+    ifd = struct.pack("<H", len(tags))
+    for tag, kind, count, value in tags:
+        ifd += struct.pack("<HHI", tag, kind, count) + value.ljust(4, b"\x00")
+    exif = b"Exif\x00\x00" + b"II*\x00" + struct.pack("<I", 8) + ifd + struct.pack("<I", 0)
+    sof0 = b"\x08" + struct.pack(">HH", 48, 64) + b"\x03" + b"\x01\x22\x00" + b"\x02\x11\x01" + b"\x03\x11\x01"
+    return (
+        b"\xff\xd8"
+        + b"\xff\xe1"
+        + struct.pack(">H", len(exif) + 2)
+        + exif
+        + b"\xff\xc0"
+        + struct.pack(">H", len(sof0) + 2)
+        + sof0
+        + b"\xff\xda"
+        + struct.pack(">H", 12)
+        + b"\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00"
+        + b"\x00\x00"
+        + b"\xff\xd9"
+    )
+
+
+class TestImageFast(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def parse(self, data: bytes, composite: bool = True) -> dict | None:
+        path = os.path.join(self.tmp.name, "sample")
+        with open(path, "wb") as f:
+            f.write(data)
+        return imagefast.parse(path, composite)
+
+    def test_corpus(self):
+        self.assertEqual(
+            self.parse(CORPUS["sample.png"]()),
+            {
+                "FileType": "PNG",
+                "FileTypeExtension": "png",
+                "MIMEType": "image/png",
+                "ImageWidth": 1,
+                "ImageHeight": 1,
+                "BitDepth": 8,
+                "ColorType": "RGB",
+                "Compression": "Deflate/Inflate",
+                "Filter": "Adaptive",
+                "Interlace": "Noninterlaced",
+                "ImageSize": "1x1",
+                "Megapixels": 0.000001,
+            },
+        )
+        gif = self.parse(CORPUS["sample.gif"]())
+        self.assertIsNotNone(gif)
+        assert gif is not None
+        self.assertEqual(gif["GIFVersion"], "89a")
+        tif = self.parse(CORPUS["sample.tif"]())
+        self.assertIsNotNone(tif)
+        assert tif is not None
+        self.assertEqual(tif["ExifByteOrder"], "Little-endian (Intel, II)")
+        # no scan data, left for exiftool to report on
+        self.assertIsNone(self.parse(CORPUS["sample.jpg"]()))
+        for name in ("sample.exe", "sample.pdf", "sample.zip", "sample.mp4", "sample.json", "sample.xml"):
+            self.assertIsNone(self.parse(CORPUS[name]()), name)
+
+    def test_exif_jpeg(self):
+        record = self.parse(
+            _exif_jpeg(
+                (0x010F, 2, 4, b"Cam\x00"),
+                (0x0112, 3, 1, struct.pack("<H", 6)),
+                (0x0128, 3, 1, struct.pack("<H", 2)),
+            )
+        )
+        self.assertEqual(
+            record,
+            {
+                "FileType": "JPEG",
+                "FileTypeExtension": "jpg",
+                "MIMEType": "image/jpeg",
+                "ExifByteOrder": "Little-endian (Intel, II)",
+                "Make": "Cam",
+                "Orientation": "Rotate 90 CW",
+                "ResolutionUnit": "inches",
+                "ImageWidth": 64,
+                "ImageHeight": 48,
+                "EncodingProcess": "Baseline DCT, Huffman coding",
+                "BitsPerSample": 8,
+                "ColorComponents": 3,
+                "YCbCrSubSampling": "YCbCr4:2:0 (2 2)",
+                "ImageSize": "64x48",
+                "Megapixels": 0.003,
+            },
+        )
+        record = self.parse(_exif_jpeg(), composite=False)
+        self.assertIsNotNone(record)
+        assert record is not None
+        self.assertNotIn("ImageSize", record)
+
+    def test_unsupported(self):
+        # an EXIF tag that isn't converted here, eg. a GPS pointer
+        self.assertIsNone(self.parse(_exif_jpeg((0x8825, 4, 1, struct.pack("<I", 0)))))
+        # a text chunk exiftool would extract
+        png = CORPUS["sample.png"]()
+        self.assertIsNone(self.parse(png[:33] + _png_chunk(b"tEXt", b"Comment\x00hello") + png[33:]))
+        # data appended after the image
+        self.assertIsNone(self.parse(png + b"trailer"))
+        # another file appended to a JPEG that also ends in EOI
+        jpeg = _exif_jpeg()
+        self.assertIsNone(self.parse(jpeg + jpeg))
+        self.assertIsNone(self.parse(jpeg[:-2] + b"\xff\xd9polyglot\xff\xd9"))
+        # stuffed bytes and restart markers within the scan
+        self.assertIsNotNone(self.parse(jpeg[:-2] + b"\xff\x00\x01\xff\xd0\x02\xff\xd9"))
+
+    def test_truncated(self):
+        self.assertIsNone(self.parse(b""))
+        for name in ("sample.png", "sample.gif", "sample.tif"):
+            data = CORPUS[name]()
+            for size in range(1, len(data)):
+                self.assertIsNone(self.parse(data[:size]), (name, size))
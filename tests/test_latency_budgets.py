@@ -0,0 +1,152 @@
+"""Latency and peak memory budgets over generated pathological inputs.
+
+These are slow and need lots of scratch disk, so only run when AZUL_EXIFTOOL_STRESS=1 (eg. `tox -e stress`).
+Each input is scanned in a fresh process so exiftool's peak memory can be read back from its rusage.
+Set AZUL_EXIFTOOL_STRESS_SCALE to loosen the latency budgets on slow hosts.
+"""
+
+import concurrent.futures
+import dataclasses
+import multiprocessing
+import os
+import resource
+import struct
+import tempfile
+import time
+import tracemalloc
+import unittest
+from typing import Callable
+
+from azul_plugin_exiftool.main import AzulPluginExifTool
+
+MiB = 1024 * 1024
+# matches the plugin's default filter_max_content_size
+MAX_SIZE = 200 * MiB
+SCALE = float(os.environ.get("AZUL_EXIFTOOL_STRESS_SCALE", "1"))
+
+
+def _write_repeated(path: str, block: bytes, total: int, prefix: bytes = b"", suffix: bytes = b""):
+    """Write prefix, then block repeated to total bytes, then suffix without holding it all in memory."""
+    with open(path, "wb") as f:
+        f.write(prefix)
+        remaining = total
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+        f.write(suffix)
+
+
+def _write_sparse(path: str, size: int, tail: bytes = b""):
+    """Write a file of size zero bytes ending with tail, sparse so it costs no disk."""
+    with open(path, "wb") as f:
+        f.truncate(size - len(tail))
+        f.seek(size - len(tail))
+        f.write(tail)
+
+
+def nested_json(path: str):
+    depth = 20_000
+    with open(path, "wb") as f:
+        f.write(b'{"a":' * depth + b"1" + b"}" * depth)
+
+
+def nested_xml(path: str):
+    depth = 20_000
+    with open(path, "wb") as f:
+        f.write(b'<?xml version="1.0"?>' + b"<a>" * depth + b"x" + b"</a>" * depth)
+
+
+def wide_json(path: str):
+    with open(path, "w") as f:
+        f.write("{" + ",".join(f'"key{i}":"value{i}"' for i in range(200_000)) + "}")
+
+
+def json_huge_comment(path: str):
+    _write_repeated(path, b"x" * MiB, 32 * MiB, prefix=b'{"Comment":"', suffix=b'"}')
+
+
+def jpeg_huge_comments(path: str):
+    # hundreds of maximum length COM segments ahead of a minimal baseline frame
+    comment = b"\xff\xfe" + struct.pack(">H", 0xFFFF) + b"c" * (0xFFFF - 2)
+    sof0 = b"\xff\xc0" + struct.pack(">H", 11) + b"\x08\x00\x01\x00\x01\x01\x01\x11\x00"
+    with open(path, "wb") as f:
+        f.write(b"\xff\xd8")
+        for _ in range(500):
+            f.write(comment)
+        f.write(sof0 + b"\xff\xd9")
+
+
+def leading_zero_filler(path: str):
+    # zeros up to the last byte, so the full of zeros precheck has to read everything
+    _write_sparse(path, MAX_SIZE, b"\x01")
+
+
+def leading_ff_filler(path: str):
+    png = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)
+    _write_repeated(path, b"\xff" * MiB, 64 * MiB, suffix=png + b"\x00" * 4)
+
+
+def max_size_zeros(path: str):
+    _write_sparse(path, MAX_SIZE)
+
+
+def max_size_text(path: str):
+    line = b"the quick brown fox jumps over the lazy dog\n"
+    _write_repeated(path, line * (MiB // len(line)), MAX_SIZE)
+
+
+@dataclasses.dataclass
+class Budget:
+    """An input generator and the most it may cost to scan."""
+
+    write: Callable[[str], None]
+    seconds: float
+    exiftool_mb: int
+    python_mb: int
+
+
+BUDGETS = {
+    "nested_json": Budget(nested_json, 10, 256, 32),
+    "nested_xml": Budget(nested_xml, 10, 256, 32),
+    "wide_json": Budget(wide_json, 20, 512, 256),
+    "json_huge_comment": Budget(json_huge_comment, 15, 512, 160),
+    "jpeg_huge_comments": Budget(jpeg_huge_comments, 15, 512, 192),
+    "leading_zero_filler": Budget(leading_zero_filler, 30, 256, 16),
+    "leading_ff_filler": Budget(leading_ff_filler, 20, 256, 16),
+    "max_size_zeros": Budget(max_size_zeros, 15, 64, 16),
+    "max_size_text": Budget(max_size_text, 45, 512, 16),
+}
+
+
+def measure(path: str) -> dict:
+    """Scan path with a fresh plugin, returning latency and peak memory (run in its own process)."""
+    plugin = AzulPluginExifTool(config={})
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = plugin.scan_path(path)
+    seconds = time.perf_counter() - start
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": seconds,
+        # ru_maxrss is in KiB on linux, the largest of every exiftool run in this process
+        "exiftool_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        "python_mb": python_peak / MiB,
+        "state": result.state.label if result.state else None,
+        "malformed": result.malformed,
+    }
+
+
+@unittest.skipUnless(os.environ.get("AZUL_EXIFTOOL_STRESS") == "1", "set AZUL_EXIFTOOL_STRESS=1 to run")
+class TestLatencyBudgets(unittest.TestCase):
+    def test_budgets(self):
+        context = multiprocessing.get_context("spawn")
+        for name, budget in BUDGETS.items():
+            with self.subTest(name), tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, name)
+                budget.write(path)
+                with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                    m = pool.submit(measure, path).result()
+                self.assertLessEqual(m["seconds"], budget.seconds * SCALE, m)
+                self.assertLessEqual(m["exiftool_mb"], budget.exiftool_mb, m)
+                self.assertLessEqual(m["python_mb"], budget.python_mb, m)
@@ -0,0 +1,48 @@
+import unittest
+
+from azul_plugin_exiftool.loadcontrol import DegradationController, mode_options
+
+
+class TestDegradationController(unittest.TestCase):
+    def test_disabled_by_default(self):
+        control = DegradationController([], [])
+        for _ in range(10):
+            self.assertEqual(control.begin(), "full")
+            control.end(1000.0)
+
+    def test_latency_degrades_and_recovers(self):
+        control = DegradationController([5.0, 10.0, 20.0], [], window=2)
+        self.assertEqual(control.begin(), "full")
+        control.end(12.0)
+        self.assertEqual(control.mode, "fast2")
+        self.assertEqual(control.begin(), "fast2")
+        control.end(30.0)
+        # mean of 12 and 30
+        self.assertEqual(control.mode, "restricted")
+        control.begin()
+        control.end(12.0)
+        # mean of 30 and 12 is 21, still above 20
+        self.assertEqual(control.mode, "restricted")
+        control.begin()
+        control.end(5.0)
+        # mean of 12 and 5 is 8.5 which is below 10 but not below the 8 recovery point of fast2
+        self.assertEqual(control.mode, "fast2")
+        control.begin()
+        control.end(1.0)
+        self.assertEqual(control.mode, "full")
+
+    def test_inflight_degrades(self):
+        control = DegradationController([], [2, 3])
+        self.assertEqual(control.begin(), "full")
+        self.assertEqual(control.begin(), "fast")
+        self.assertEqual(control.begin(), "fast2")
+        control.end(0.1)
+        control.end(0.1)
+        control.end(0.1)
+        self.assertEqual(control.mode, "full")
+
+    def test_mode_options(self):
+        self.assertEqual(mode_options("full", ["File:all"]), [])
+        self.assertEqual(mode_options("fast", ["File:all"]), ["-fast"])
+        self.assertEqual(mode_options("fast2", ["File:all"]), ["-fast2"])
+        self.assertEqual(mode_options("restricted", ["File:all", "EXE:all"]), ["-fast2", "-File:all", "-EXE:all"])
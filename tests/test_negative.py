@@ -0,0 +1,135 @@
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+
+from azul_plugin_exiftool.negative import MALFORMED, OPT_OUT, UNKNOWN_FILE_TYPE, BloomFilter, NegativeIndex
+
+
+def sha(i: int) -> str:
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_membership(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(sha(i))
+        self.assertTrue(all(sha(i) in bloom for i in range(1000)))
+        # a few entries collide with ones already added, so aren't counted
+        self.assertGreater(bloom.count, 980)
+        # close to the requested rate at capacity
+        false_positives = sum(sha(i) in bloom for i in range(1000, 21000))
+        self.assertLess(false_positives / 20000, 0.02)
+        self.assertAlmostEqual(bloom.expected_error_rate(), 0.01, delta=0.005)
+
+
+class TestNegativeIndex(unittest.TestCase):
+    def test_check_and_observe(self):
+        index = NegativeIndex("13.25", verify_every=0)
+        self.assertIsNone(index.check(sha(1)))
+        index.observe(sha(1), UNKNOWN_FILE_TYPE, "Unknown file type")
+        index.observe(sha(2), OPT_OUT, "First 1995 bytes of file is binary zeros")
+        index.observe(sha(3), MALFORMED, "Entire file is binary 0xff's")
+        index.observe(sha(4), None)
+        self.assertEqual(index.check(sha(1)), (UNKNOWN_FILE_TYPE, "Unknown file type"))
+        self.assertEqual(index.check(sha(2)), (OPT_OUT, "First 1995 bytes of file is binary zeros"))
+        self.assertEqual(index.check(sha(3)), (MALFORMED, "Entire file is binary 0xff's"))
+        self.assertIsNone(index.check(sha(4)))
+        self.assertEqual(index.report()["hits"], 3)
+
+    def test_bounded_messages(self):
+        index = NegativeIndex("13.25", max_messages=2, verify_every=0)
+        for i in range(3):
+            index.observe(sha(i), OPT_OUT, f"First {i} bytes of file is binary zeros")
+        self.assertIsNone(index.check(sha(0)))
+        self.assertIsNotNone(index.check(sha(2)))
+
+    def test_verification(self):
+        index = NegativeIndex("13.25", verify_every=2)
+        index.observe(sha(1), OPT_OUT, "First 10 bytes of file is binary zeros")
+        self.assertIsNotNone(index.check(sha(1)))
+        # the second hit is let through to be verified
+        self.assertIsNone(index.check(sha(1)))
+        index.observe(sha(1), None)
+        report = index.report()
+        self.assertEqual((report["verified"], report["false_positives"]), (1, 1))
+        # the wrong entry is forgotten
+        self.assertIsNone(index.check(sha(1)))
+
+    def test_filter_false_positive_excepted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "negative.idx")
+            index = NegativeIndex("13.25", path, verify_every=1)
+            index.observe(sha(1), UNKNOWN_FILE_TYPE, "Unknown file type")
+            # stands in for a different sample colliding in the filter, which exiftool can read
+            self.assertIsNone(index.check(sha(1)))
+            index.observe(sha(1), None)
+            self.assertEqual(index.report()["false_positives"], 1)
+            index.verify_every = 0
+            # the filter still matches it, but it is never answered from the index again
+            self.assertIn(sha(1), index.filter)
+            self.assertIsNone(index.check(sha(1)))
+            index.save()
+            self.assertIsNone(NegativeIndex("13.25", path, verify_every=0).check(sha(1)))
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "negative.idx")
+            index = NegativeIndex("13.25", path, capacity=100, save_interval=2)
+            index.observe(sha(1), UNKNOWN_FILE_TYPE, "Unknown file type")
+            self.assertFalse(os.path.exists(path))
+            index.observe(sha(2), MALFORMED, "Entire file is binary 0xff's")
+            self.assertTrue(os.path.exists(path))
+
+            loaded = NegativeIndex("13.25", path, capacity=100, verify_every=0)
+            self.assertEqual(loaded.check(sha(1)), (UNKNOWN_FILE_TYPE, "Unknown file type"))
+            self.assertEqual(loaded.check(sha(2)), (MALFORMED, "Entire file is binary 0xff's"))
+            # an index built by another exiftool version is not trusted
+            other = NegativeIndex("12.76", path, capacity=100, verify_every=0)
+            self.assertIsNone(other.check(sha(1)))
+
+    def test_shared_path(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "negative.idx")
+
+            def observe(start: int):
+                index = NegativeIndex("13.25", path, capacity=1000, save_interval=1)
+                for i in range(start, start + 200):
+                    if i % 2:
+                        index.observe(sha(i), OPT_OUT, f"First {i} bytes of file is binary zeros")
+                    else:
+                        index.observe(sha(i), UNKNOWN_FILE_TYPE, "Unknown file type")
+
+            with self.assertNoLogs("azul_plugin_exiftool.negative", "WARNING"):
+                threads = [threading.Thread(target=observe, args=(start,)) for start in (0, 200)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+            loaded = NegativeIndex("13.25", path, capacity=1000, verify_every=0)
+            self.assertTrue(all(loaded.check(sha(i)) is not None for i in range(400)))
+            # both instances' filter entries, less the few that collided
+            self.assertGreater(loaded.filter.count, 190)
+
+    def test_shared_exceptions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "negative.idx")
+            first = NegativeIndex("13.25", path, verify_every=1)
+            second = NegativeIndex("13.25", path, verify_every=0)
+            first.observe(sha(1), OPT_OUT, "First 10 bytes of file is binary zeros")
+            second.observe(sha(1), OPT_OUT, "First 10 bytes of file is binary zeros")
+            second.save()
+            # found wrong by the first instance, whose saved exception overrides the second's entry
+            self.assertIsNone(first.check(sha(1)))
+            first.observe(sha(1), None)
+            first.save()
+            second.save()
+            self.assertIsNone(NegativeIndex("13.25", path, verify_every=0).check(sha(1)))
+
+    def test_save_failure(self):
+        index = NegativeIndex("13.25", verify_every=0)
+        index.observe(sha(1), UNKNOWN_FILE_TYPE, "Unknown file type")
+        with self.assertLogs("azul_plugin_exiftool.negative", "WARNING"):
+            index.save(os.path.join(tempfile.gettempdir(), "missing", "negative.idx"))
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import tempfile
+import unittest
+
+from azul_plugin_exiftool.replay import ExifToolRecorder, ReplayMissError, normalise_args, recorded_runs
+
+SHA256 = "a" * 64
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_normalise_args(self):
+        self.assertEqual(
+            normalise_args(["/usr/bin/exiftool", "-config", "/opt/x/exiftool.config", "-json", "/tmp/s"], "/tmp/s"),
+            ["exiftool", "-config", "exiftool.config", "-json", "{sample}"],
+        )
+
+    def test_round_trip(self):
+        recorder = ExifToolRecorder(record_dir=self.tmp.name, replay_dir=self.tmp.name)
+        args = ["exiftool", "-json", "/tmp/one/sample"]
+        recorder.record(SHA256, args, "/tmp/one/sample", 0, b'[{"FileType": "JSON"}]', b"\xff warn")
+        recorder.record(SHA256, args + ["-fast"], "/tmp/one/sample", 1, b"", b"", timed_out=True)
+
+        # replayed on a different path
+        args = ["exiftool", "-json", "/tmp/two/sample"]
+        p = recorder.replay(SHA256, args, "/tmp/two/sample", 90)
+        self.assertEqual((p.returncode, p.stdout, p.stderr), (0, b'[{"FileType": "JSON"}]', b"\xff warn"))
+        self.assertEqual(p.args, args)
+        with self.assertRaises(subprocess.TimeoutExpired):
+            recorder.replay(SHA256, args + ["-fast"], "/tmp/two/sample", 90)
+        with self.assertRaises(ReplayMissError):
+            recorder.replay(SHA256, args + ["-fast2"], "/tmp/two/sample", 90)
+        with self.assertRaises(ReplayMissError):
+            recorder.replay("b" * 64, args, "/tmp/two/sample", 90)
+
+        self.assertEqual([sha for sha, _ in recorded_runs(self.tmp.name)], [SHA256])
+
+    def test_rerecord_replaces(self):
+        recorder = ExifToolRecorder(record_dir=self.tmp.name)
+        args = ["exiftool", "-json", "/s"]
+        recorder.record(SHA256, args, "/s", 0, b"old", b"")
+        recorder.record(SHA256, args, "/s", 0, b"new", b"")
+        self.assertEqual(os.listdir(self.tmp.name), [f"{SHA256}.json"])
+        ((_, p),) = recorded_runs(self.tmp.name)
+        self.assertEqual(p.stdout, b"new")
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from azul_plugin_exiftool.scheduler import LARGE, SMALL, LaneScheduler, size_bucket, sniff_type
+
+
+class TestLaneScheduler(unittest.TestCase):
+    def test_sniff_type(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "f")
+            for head, expected in ((b"MZ\x90\x00", "pe"), (b"\x00\x00\x00\x18ftypmp42", "quicktime"), (b"", "other")):
+                with open(path, "wb") as f:
+                    f.write(head)
+                self.assertEqual(sniff_type(path), expected)
+
+    def test_size_bucket(self):
+        self.assertEqual(size_bucket(0), 0)
+        self.assertEqual(size_bucket(65536), 0)
+        self.assertEqual(size_bucket(65537), 1)
+        self.assertEqual(size_bucket(4 * 65536), 1)
+        self.assertEqual(size_bucket(200 * 1024 * 1024), 6)
+
+    def test_classify_learns_cost(self):
+        scheduler = LaneScheduler(slots=2, small_max_bytes=1000, small_max_seconds=0.01)
+        self.assertEqual(scheduler.classify("pdf", 2000), LARGE)
+        self.assertEqual(scheduler.classify("pdf", 100), SMALL)
+        with scheduler.slot("pdf", 100):
+            time.sleep(0.02)
+        self.assertEqual(scheduler.classify("pdf", 100), LARGE)
+        self.assertEqual(scheduler.classify("png", 100), SMALL)
+
+    def test_reserved_small_capacity(self):
+        scheduler = LaneScheduler(slots=2, small_reserved=1, small_max_bytes=1000)
+        release = threading.Event()
+        started = []
+
+        def run(size):
+            with scheduler.slot("other", size) as lane:
+                started.append(lane)
+                release.wait(5)
+
+        threads = [threading.Thread(target=run, args=(5000,)) for _ in range(2)]
+        for t in threads:
+            t.start()
+        deadline = time.monotonic() + 5
+        while scheduler.lanes[LARGE].waiting != 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        # one large run holds the shared slot, the other waits as the remaining slot is reserved
+        self.assertEqual(started, [LARGE])
+        small = threading.Thread(target=run, args=(10,))
+        small.start()
+        while len(started) < 2 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertEqual(started, [LARGE, SMALL])
+        release.set()
+        for t in threads + [small]:
+            t.join()
+        report = scheduler.report()
+        self.assertEqual(report[LARGE]["jobs"], 2)
+        self.assertEqual(report[SMALL]["jobs"], 1)
+        self.assertGreater(report[LARGE]["max_wait_seconds"], 0)
+
+    def test_large_lane_not_starved(self):
+        scheduler = LaneScheduler(slots=2, small_reserved=1, small_max_bytes=1000, small_max_streak=1)
+        releases = {}
+        started = []
+
+        def run(name, size):
+            with scheduler.slot("other", size):
+                started.append(name)
+                releases[name].wait(5)
+
+        def start(name, size, waiting_lane=None):
+            releases[name] = threading.Event()
+            thread = threading.Thread(target=run, args=(name, size))
+            thread.start()
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                if name in started or (waiting_lane and scheduler.lanes[waiting_lane].waiting):
+                    break
+                time.sleep(0.001)
+            return thread
+
+        threads = [start("large1", 5000), start("large2", 5000, LARGE), start("small1", 10)]
+        # the shared slot is full, so this small sample waits for whichever slot frees up
+        threads.append(start("small2", 10, SMALL))
+        self.assertEqual(started, ["large1", "small1"])
+        releases["large1"].set()
+        deadline = time.monotonic() + 5
+        while len(started) < 3 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        # small1 started while large2 waited, so the freed shared slot goes to large2 rather than small2
+        time.sleep(0.05)
+        self.assertEqual(started, ["large1", "small1", "large2"])
+        for release in releases.values():
+            release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(started[-1], "small2")
+
+    def test_disabled_admits_everything(self):
+        scheduler = LaneScheduler(slots=0)
+        self.assertFalse(scheduler.enabled)
+        with scheduler.slot("other", 10**9), scheduler.slot("other", 10**9):
+            pass
+        self.assertEqual(scheduler.report()[LARGE]["jobs"], 2)
@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from azul_plugin_exiftool.slowjobs import ScanTrace, SlowJobRecorder
+
+
+class TestSlowJobRecorder(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.sample = os.path.join(self.tmp.name, "sample.bin")
+        with open(self.sample, "wb") as f:
+            f.write(b"slow sample")
+        self.reports = os.path.join(self.tmp.name, "reports")
+
+    def test_fast_job_not_captured(self):
+        recorder = SlowJobRecorder(60.0, self.reports)
+        with recorder.watch(ScanTrace(self.sample)):
+            pass
+        self.assertFalse(os.path.exists(self.reports))
+
+    def test_disabled(self):
+        recorder = SlowJobRecorder(0, self.reports)
+        self.assertFalse(recorder.enabled)
+        with recorder.watch(ScanTrace(self.sample)):
+            time.sleep(0.01)
+        self.assertFalse(os.path.exists(self.reports))
+
+    def test_slow_job_captured_with_profile(self):
+        recorder = SlowJobRecorder(0.001, self.reports, profile=True)
+        trace = ScanTrace(self.sample)
+        trace.exiftool_args = ["exiftool", "-json", self.sample]
+        trace.exiftool_stderr = b"Warning: something odd"
+        trace.file_type = "JPEG"
+        with recorder.watch(trace):
+            with trace.phase("exiftool"):
+                time.sleep(0.01)
+        (report_dir,) = os.listdir(self.reports)
+        with open(os.path.join(self.reports, report_dir, "report.json")) as f:
+            report = json.load(f)
+        self.assertEqual(report["sha256"], "96dfc5b81180c5edef2505d08d162871e9aa33185a18c682202fe38c35015cf9")
+        self.assertEqual(report["size"], 11)
+        self.assertEqual(report["file_type"], "JPEG")
+        self.assertEqual(report["exiftool_args"], ["exiftool", "-json", self.sample])
+        self.assertEqual(report["exiftool_stderr"], "Warning: something odd")
+        self.assertGreaterEqual(report["timings"]["exiftool"], 0.01)
+        self.assertIsNone(report["error"])
+        self.assertTrue(os.path.exists(os.path.join(self.reports, report_dir, "profile.pstats")))
+
+    def test_exception_captured_and_reraised(self):
+        recorder = SlowJobRecorder(0.001, self.reports)
+        with self.assertRaises(TimeoutError):
+            with recorder.watch(ScanTrace(self.sample)):
+                time.sleep(0.01)
+                raise TimeoutError("took too long")
+        (report_dir,) = os.listdir(self.reports)
+        with open(os.path.join(self.reports, report_dir, "report.json")) as f:
+            self.assertEqual(json.load(f)["error"], "TimeoutError: took too long")
+
+    def test_rotation(self):
+        recorder = SlowJobRecorder(0.001, self.reports, max_reports=2)
+        for _ in range(4):
+            with recorder.watch(ScanTrace(self.sample)):
+                time.sleep(0.002)
+        self.assertEqual(len(os.listdir(self.reports)), 2)
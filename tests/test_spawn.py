@@ -0,0 +1,50 @@
+import os
+import subprocess
+import unittest
+
+from azul_plugin_exiftool.spawn import Launcher, exiftool_env
+
+
+class TestLauncher(unittest.TestCase):
+    def setUp(self):
+        self.launcher = Launcher()
+
+    def test_run(self):
+        p, usage = self.launcher.run(["sh", "-c", "echo $TZ; echo failed >&2; exit 3"], timeout=10)
+        self.assertEqual(p.returncode, 3)
+        self.assertEqual(p.stdout, b"UTC\n")
+        self.assertEqual(p.stderr, b"failed\n")
+        self.assertGreater(usage.ru_maxrss, 0)
+
+    def test_large_output(self):
+        # more than a pipe buffer on both streams, so neither can block the other
+        p, _ = self.launcher.run(["sh", "-c", "head -c 1000000 /dev/zero; head -c 1000000 /dev/zero >&2"], timeout=10)
+        self.assertEqual((len(p.stdout), len(p.stderr)), (1000000, 1000000))
+
+    def test_timeout(self):
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.launcher.run(["sleep", "10"], timeout=0.2)
+
+    def test_descriptors(self):
+        before = len(os.listdir("/proc/self/fd"))
+        p, _ = self.launcher.run(["ls", "/proc/self/fd"], timeout=10)
+        # only stdin, stdout and stderr (and ls' own handle on the listing) reach the child
+        self.assertLessEqual(len(p.stdout.split()), 4)
+        self.assertEqual(len(os.listdir("/proc/self/fd")), before)
+
+    def test_inheritable_descriptors(self):
+        # as left by code outside Python that doesn't set close-on-exec
+        r, w = os.pipe()
+        self.addCleanup(os.close, r)
+        self.addCleanup(os.close, w)
+        os.set_inheritable(w, True)
+        p, _ = self.launcher.run(["sh", "-c", f"test -e /proc/self/fd/{w} && echo open || echo closed"], timeout=10)
+        self.assertEqual(p.stdout, b"closed\n")
+        self.assertTrue(os.get_inheritable(w))
+
+    def test_missing_executable(self):
+        with self.assertRaises(FileNotFoundError):
+            self.launcher.run(["azul-missing-exiftool"], timeout=10)
+
+    def test_env(self):
+        self.assertEqual(exiftool_env()["TZ"], "UTC")
@@ -0,0 +1,133 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+
+from azul_plugin_exiftool.stats import TagStatistics
+
+
+def _observe_in_worker(path: str):
+    stats = TagStatistics(path, interval=1000)
+    stats.observe("PNG", [("ImageWidth", 2, False)])
+
+
+class TestTagStatistics(unittest.TestCase):
+    def test_report(self):
+        stats = TagStatistics()
+        stats.observe("JPEG", [("ImageWidth", 4, False), ("Comment", 5000, True)])
+        stats.observe("JPEG", [("ImageWidth", 3, False)])
+        stats.observe("", [("Title", 2, False)])
+        stats.observe_cost("JPEG", 0.5)
+        stats.observe_cost("JPEG", 1.5)
+
+        report = stats.report()["file_types"]
+        self.assertEqual(list(report), ["JPEG", "unknown"])
+        self.assertEqual(report["JPEG"]["jobs"], 2)
+        self.assertEqual(report["JPEG"]["mean_exiftool_seconds"], 1.0)
+        self.assertEqual(
+            report["JPEG"]["tags"],
+            {
+                "ImageWidth": {
+                    "count": 2,
+                    "frequency": 1.0,
+                    "mean_length": 3.5,
+                    "truncation_rate": 0.0,
+                    "total_length": 7,
+                    "truncated": 0,
+                },
+                "Comment": {
+                    "count": 1,
+                    "frequency": 0.5,
+                    "mean_length": 5000.0,
+                    "truncation_rate": 1.0,
+                    "total_length": 5000,
+                    "truncated": 1,
+                },
+            },
+        )
+        self.assertIsNone(report["unknown"]["mean_exiftool_seconds"])
+
+    def test_periodic_write(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stats.json")
+            stats = TagStatistics(path, interval=2)
+            stats.observe("PNG", [("ImageWidth", 2, False)])
+            stats.observe_cost("PNG", 0.1)
+            self.assertFalse(os.path.exists(path))
+            stats.observe_cost("PNG", 0.1)
+            with open(path) as f:
+                self.assertEqual(json.load(f)["file_types"]["PNG"]["tags"]["ImageWidth"]["count"], 1)
+
+    def test_flush(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stats.json")
+            stats = TagStatistics(path, interval=1000)
+            stats.flush()
+            self.assertFalse(os.path.exists(path))
+            stats.observe("PNG", [("ImageWidth", 2, False)])
+            stats.flush()
+            with open(path) as f:
+                self.assertEqual(json.load(f)["file_types"]["PNG"]["jobs"], 1)
+            os.remove(path)
+            # nothing new since the last write
+            stats.flush()
+            self.assertFalse(os.path.exists(path))
+
+    def test_shared_report(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stats.json")
+            first, second = TagStatistics(path), TagStatistics(path)
+            first.observe("PNG", [("ImageWidth", 2, False)])
+            first.observe_cost("PNG", 1.0)
+            second.observe("PNG", [("ImageWidth", 4, True)])
+            second.observe_cost("PNG", 3.0)
+            first.write()
+            second.write()
+            # only counts since the last write are added
+            first.write()
+            with open(path) as f:
+                report = json.load(f)["file_types"]["PNG"]
+            self.assertEqual(report["jobs"], 2)
+            self.assertEqual(report["mean_exiftool_seconds"], 2.0)
+            self.assertEqual(report["tags"]["ImageWidth"]["mean_length"], 3.0)
+            self.assertEqual(report["tags"]["ImageWidth"]["truncation_rate"], 0.5)
+            # each instance still reports its own counts
+            self.assertEqual(first.report()["file_types"]["PNG"]["jobs"], 1)
+
+    def test_concurrent_writers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stats.json")
+
+            def observe():
+                stats = TagStatistics(path, interval=1)
+                for _ in range(50):
+                    stats.observe("PNG", [("ImageWidth", 2, False)])
+                    stats.observe_cost("PNG", 0.1)
+
+            with self.assertNoLogs("azul_plugin_exiftool.stats"):
+                threads = [threading.Thread(target=observe) for _ in range(4)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+            with open(path) as f:
+                self.assertEqual(json.load(f)["file_types"]["PNG"]["jobs"], 200)
+
+    def test_write_failure(self):
+        stats = TagStatistics()
+        stats.observe("PNG", [("ImageWidth", 2, False)])
+        with self.assertLogs("azul_plugin_exiftool.stats", "WARNING"):
+            stats.write(os.path.join(tempfile.gettempdir(), "missing", "stats.json"))
+        # kept to add to a later successful write
+        self.assertTrue(stats._unwritten)
+
+    def test_worker_exit(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stats.json")
+            worker = multiprocessing.get_context("fork").Process(target=_observe_in_worker, args=(path,))
+            worker.start()
+            worker.join()
+            with open(path) as f:
+                self.assertEqual(json.load(f)["file_types"]["PNG"]["jobs"], 1)
@@ -0,0 +1,32 @@
+import os
+import tempfile
+import unittest
+
+from azul_plugin_exiftool.scheduler import sniff_type
+from azul_plugin_exiftool.warmup import CORPUS, warm_exiftool
+
+
+class TestWarmup(unittest.TestCase):
+    def test_corpus_types(self):
+        expected = {
+            "sample.png": "png",
+            "sample.gif": "gif",
+            "sample.jpg": "jpeg",
+            "sample.tif": "tiff",
+            "sample.exe": "pe",
+            "sample.pdf": "pdf",
+            "sample.zip": "zip",
+            "sample.mp4": "quicktime",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, build in CORPUS.items():
+                path = os.path.join(tmp, name)
+                with open(path, "wb") as f:
+                    f.write(build())
+                self.assertEqual(sniff_type(path), expected.get(name, "other"), name)
+
+    def test_warm_exiftool(self):
+        report = warm_exiftool(["exiftool", "-json"])
+        self.assertEqual(report["files"], len(CORPUS))
+        self.assertGreater(report["cold_seconds"], 0)
+        self.assertLessEqual(report["warm_mean_seconds"], report["warm_max_seconds"])